@@ -4,18 +4,25 @@ from __future__ import annotations
 import argparse
 import json
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
-
-from openai import OpenAI
+from typing import Any, Dict, List, Optional
 
+from rag.answer_cache import normalize_question
+from rag.context import pack_context
+from rag.filters import RetrievalFilter
+from rag.openai_client import chat_completion
 from rag.retriever import retrieve
+from rag.singleflight import SingleFlight, flight_key
 from agents.prompts import AGENT_SYSTEM_PROMPT, AGENT_USER_PROMPT_TEMPLATE
 
 REFUSAL = "The provided context does not contain enough information to answer this question."
 
+# Identical concurrent requests share one retrieval + LLM run (see rag/singleflight.py).
+SINGLE_FLIGHT_ENABLED = os.getenv("RAG_SINGLE_FLIGHT", "1") == "1"
+_FLIGHTS = SingleFlight()
+
 
 @dataclass
 class AgentResult:
@@ -23,27 +30,24 @@ class AgentResult:
     json: Dict[str, Any]
     markdown: str
     retrieved_chunk_indices: List[int]
+    coalesced: bool = False  # shared from a concurrent identical request
 
 
 def _format_chunks_for_prompt(chunks) -> str:
     # chunks are your rag.retriever.Chunk objects
+    # Neighbouring chunks are merged (overlap removed) and cited by their first chunk_index;
+    # the token budget replaces the old per-chunk 900-char cut.
+    packed = pack_context(chunks, label="chunk_index")
     lines = []
-    for c in chunks:
+    for b in packed.blocks:
         # keep it compact but usable
-        snippet = c.text.strip().replace("\n", " ")
-        if len(snippet) > 900:
-            snippet = snippet[:900] + "..."
-        lines.append(f"[{c.chunk_index}] {snippet}")
+        snippet = b.text.strip().replace("\n", " ")
+        lines.append(f"[{b.citation}] {snippet}")
     return "\n".join(lines)
 
 
 def _call_llm_json(prompt: str) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set")
-
-    client = OpenAI(api_key=api_key)
-    resp = client.chat.completions.create(
+    resp = chat_completion(
         model=os.getenv("AGENT_MODEL", "gpt-4.1-mini"),
         temperature=0.2,
         messages=[
@@ -118,8 +122,20 @@ def _render_markdown(request: str, payload: Dict[str, Any]) -> str:
     return "\n".join(md)
 
 
-def run_doc_to_action_agent(request: str, top_k: int = 8) -> AgentResult:
-    chunks = retrieve(request, top_k=top_k)
+def run_doc_to_action_agent(
+    request: str,
+    top_k: int = 8,
+    filters: Optional[RetrievalFilter] = None,
+) -> AgentResult:
+    if not SINGLE_FLIGHT_ENABLED:
+        return _run_agent(request, top_k, filters)
+    key = flight_key(normalize_question(request), top_k, os.getenv("AGENT_MODEL", "gpt-4.1-mini"), filters)
+    result, shared = _FLIGHTS.do(key, lambda: _run_agent(request, top_k, filters))
+    return replace(result, request=request, coalesced=True) if shared else result
+
+
+def _run_agent(request: str, top_k: int, filters: Optional[RetrievalFilter]) -> AgentResult:
+    chunks = retrieve(request, top_k=top_k, filters=filters)
     chunk_indices = [c.chunk_index for c in chunks]
 
     chunks_text = _format_chunks_for_prompt(chunks)
@@ -136,13 +152,15 @@ def main():
     p = argparse.ArgumentParser(description="Doc-to-Action Agent (RAG + structured output + report).")
     p.add_argument("--request", required=True, help="Client request / objective")
     p.add_argument("--top-k", type=int, default=8)
+    p.add_argument("--source", action="append", help="Only use chunks from this source PDF (repeatable)")
     p.add_argument("--out-dir", default="artifacts/agent")
     args = p.parse_args()
 
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    result = run_doc_to_action_agent(args.request, top_k=args.top_k)
+    filters = RetrievalFilter(source=args.source) if args.source else None
+    result = run_doc_to_action_agent(args.request, top_k=args.top_k, filters=filters)
 
     (out_dir / "result.json").write_text(json.dumps(result.json, indent=2, ensure_ascii=False), encoding="utf-8")
     (out_dir / "report.md").write_text(result.markdown, encoding="utf-8")
@@ -5,9 +5,10 @@ from datetime import datetime
 import streamlit as st
 from dotenv import load_dotenv
 
-from rag.ingest import ingest_pdf_bytes
+from rag.filters import RetrievalFilter
+from rag.jobs import IngestJobRunner
 from rag.generator import answer_question
-from rag.store import collection_count
+from rag.store import collection_count, indexed_sources
 
 from agents.doc_to_action_agent import run_doc_to_action_agent
 
@@ -15,6 +16,12 @@ load_dotenv()
 
 st.set_page_config(page_title="RAG Evaluation Demo", page_icon="📚", layout="wide")
 
+@st.cache_resource
+def get_ingest_runner() -> IngestJobRunner:
+    # One runner per server process, shared by all sessions (jobs are de-duplicated by sha256).
+    return IngestJobRunner()
+
+
 st.title("📚 RAG Demo (GDPR) — Retrieval + Citations")
 st.caption("UI-only app: all RAG logic lives under the `rag/` package.")
 
@@ -32,21 +39,76 @@ with col1:
 with col2:
     st.write(f"Indexed chunks: **{collection_count()}**")
 
-if uploaded_file is not None:
-    with st.spinner("Ingesting PDF into Chroma..."):
-        n_chunks = ingest_pdf_bytes(
-            uploaded_file.getvalue(),
-            filename=uploaded_file.name,
-            reset=reset_index,
+runner = get_ingest_runner()
+
+if uploaded_file is not None and st.session_state.get("ingest_file_id") != uploaded_file.file_id:
+    # Only when a new file is picked, not on every rerun (chat messages, sliders, status ticks).
+    # The UploadedFile itself is handed over: no getvalue() copy of the upload.
+    job = runner.submit(uploaded_file, filename=uploaded_file.name, reset=reset_index)
+    st.session_state.ingest_file_id = uploaded_file.file_id
+    st.session_state.ingest_job_id = job.job_id
+
+
+@st.fragment(run_every=1.0 if runner.has_active() else None)
+def ingest_status():
+    job = runner.get(st.session_state.get("ingest_job_id", ""))
+    if job is None:
+        return
+
+    if job.active:
+        st.info(
+            f"Indexing `{job.filename}` in the background ({job.status})... "
+            f"{job.stats.chunks} chunks embedded so far. You can keep chatting meanwhile."
         )
-    if n_chunks == 0:
+    elif job.status == "failed":
+        st.error(f"Ingestion of `{job.filename}` failed: {job.error}")
+    elif job.n_chunks == 0:
         st.error("No text found in the PDF.")
     else:
-        st.success(f"Indexed **{n_chunks}** chunks from `{uploaded_file.name}`.")
+        st.success(f"Indexed **{job.n_chunks}** chunks from `{job.filename}`.")
         st.write(f"New total chunks: **{collection_count()}**")
 
+    # Refresh the whole page once when a job finishes (counts, buttons).
+    # A re-run of the same upload (after a reset) reuses the job id, hence created_at.
+    if not job.active and st.session_state.get("ingest_done_seen") != (job.job_id, job.created_at):
+        st.session_state.ingest_done_seen = (job.job_id, job.created_at)
+        st.rerun()
+
+
+ingest_status()
+
 st.divider()
 
+# -----------------------------
+# Shared: Retrieval filters (sidebar), used by chat and agent
+# -----------------------------
+with st.sidebar:
+    st.subheader("Retrieval filters")
+    selected_sources = st.multiselect("Source documents", indexed_sources(), help="Empty = all documents")
+    c1, c2 = st.columns(2)
+    with c1:
+        chunk_min = st.number_input("From chunk", min_value=0, value=None, step=1)
+        page_min = st.number_input("From page", min_value=1, value=None, step=1)
+    with c2:
+        chunk_max = st.number_input("To chunk", min_value=0, value=None, step=1)
+        page_max = st.number_input("To page", min_value=1, value=None, step=1)
+
+# Page bounds are plain metadata predicates (chunks that overlap the page range).
+page_where = []
+if page_min is not None:
+    page_where.append({"page_end": {"$gte": int(page_min)}})
+if page_max is not None:
+    page_where.append({"page_start": {"$lte": int(page_max)}})
+
+retrieval_filter = None
+if selected_sources or chunk_min is not None or chunk_max is not None or page_where:
+    retrieval_filter = RetrievalFilter(
+        source=selected_sources or None,
+        chunk_index_min=chunk_min,
+        chunk_index_max=chunk_max,
+        where=(page_where[0] if len(page_where) == 1 else {"$and": page_where}) if page_where else None,
+    )
+
 # =============================
 # TAB 1) CHAT
 # =============================
@@ -74,18 +136,24 @@ with tab_chat:
             st.session_state.messages.append({"role": "assistant", "content": msg})
         else:
             with st.chat_message("assistant"):
-                with st.spinner("Retrieving context and generating answer..."):
-                    result = answer_question(user_input, top_k=4)
+                with st.spinner("Retrieving context..."):
+                    stream = answer_question(user_input, top_k=4, filters=retrieval_filter, stream=True)
 
-                st.markdown(result.answer)
+                st.write_stream(stream)
+                result = stream.result
 
                 with st.expander("Retrieved context (debug)"):
-                    for i, ch in enumerate(result.chunks, start=1):
-                        st.markdown(
-                            f"**[{i}]** source=`{ch.source}` chunk_index=`{ch.chunk_index}` "
-                            f"distance=`{ch.distance:.4f}` id=`{ch.id}`"
-                        )
-                        st.write(ch.text)
+                    by_id = {ch.id: ch for ch in result.chunks}
+                    for n, ids in result.citations.items():
+                        for cid in ids:
+                            ch = by_id[cid]
+                            # exact-reference hits ("Article 17") skip the embedding, so no distance
+                            dist = "n/a" if ch.distance is None else f"{ch.distance:.4f}"
+                            st.markdown(
+                                f"**[{n}]** source=`{ch.source}` chunk_index=`{ch.chunk_index}` "
+                                f"distance=`{dist}` id=`{ch.id}`"
+                            )
+                            st.write(ch.text)
 
             st.session_state.messages.append({"role": "assistant", "content": result.answer})
 
@@ -123,7 +191,7 @@ with tab_agent:
             st.error("Please enter a request.")
         else:
             with st.spinner("Running agent (retrieve → plan → JSON → report)..."):
-                result = run_doc_to_action_agent(req.strip(), top_k=top_k)
+                result = run_doc_to_action_agent(req.strip(), top_k=top_k, filters=retrieval_filter)
 
             st.success("Done.")
 
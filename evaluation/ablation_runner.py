@@ -9,6 +9,7 @@ from dotenv import load_dotenv
 from evaluation.judge import judge_answer
 from rag.generator import answer_question
 from rag.ingest import ingest_pdf_dir
+from rag.retriever import format_context, retrieve_many
 from rag.store import VectorStoreConfig
 
 
@@ -26,6 +27,8 @@ def main():
     p.add_argument("--topk", default="2,4,8", help="Comma-separated top_k values")
     p.add_argument("--chunk-sizes", default="800,1000,1500", help="Comma-separated chunk_size values")
     p.add_argument("--chunk-overlap", type=int, default=200)
+    p.add_argument("--mmr-lambdas", default="", help="Comma-separated MMR lambda values (empty = skip MMR ablation)")
+    p.add_argument("--mmr-fetch-k", type=int, default=20)
     p.add_argument("--output", default="evaluation/artifacts/ablation_results.json")
     p.add_argument("--judge-model", default="gpt-4.1-mini")
     args = p.parse_args()
@@ -45,12 +48,13 @@ def main():
         ingest_pdf_dir(Path(args.pdf_dir), reset=True, chunk_size=cs, chunk_overlap=args.chunk_overlap, config=cfg)
 
         scores = []
-        for q in questions:
-            rag = answer_question(q, top_k=4)
+        retrieved = retrieve_many(questions, top_k=4, config=cfg)
+        for q, chunks in zip(questions, retrieved):
+            rag = answer_question(q, top_k=4, chunks=chunks)
             jr = judge_answer(
                 question=q,
                 answer=rag.answer,
-                context="\n\n".join([f"[{i}] {c.text}" for i, c in enumerate(rag.chunks, start=1)]),
+                context=format_context(rag.chunks),  # same [n] blocks the answer cites
                 ideal_answer=None,  # could use ideal if present; keep None for general benchmark
                 model=args.judge_model,
             )
@@ -73,12 +77,13 @@ def main():
 
     for k in topk_values:
         scores = []
-        for q in questions:
-            rag = answer_question(q, top_k=k)
+        retrieved = retrieve_many(questions, top_k=k, config=cfg)
+        for q, chunks in zip(questions, retrieved):
+            rag = answer_question(q, top_k=k, chunks=chunks)
             jr = judge_answer(
                 question=q,
                 answer=rag.answer,
-                context="\n\n".join([f"[{i}] {c.text}" for i, c in enumerate(rag.chunks, start=1)]),
+                context=format_context(rag.chunks),  # same [n] blocks the answer cites
                 ideal_answer=None,
                 model=args.judge_model,
             )
@@ -96,6 +101,38 @@ def main():
         )
         print(f"[top_k={k}] mean_overall={results[-1]['mean_overall']:.3f}")
 
+    # Ablation: MMR diversification at top_k=4 (same index as above)
+    mmr_lambdas = [float(x.strip()) for x in args.mmr_lambdas.split(",") if x.strip()]
+    for lam in mmr_lambdas:
+        scores = []
+        retrieved = retrieve_many(
+            questions, top_k=4, config=cfg, mmr=True, fetch_k=args.mmr_fetch_k, mmr_lambda=lam
+        )
+        for q, chunks in zip(questions, retrieved):
+            rag = answer_question(q, top_k=4, chunks=chunks)
+            jr = judge_answer(
+                question=q,
+                answer=rag.answer,
+                context=format_context(rag.chunks),  # same [n] blocks the answer cites
+                ideal_answer=None,
+                model=args.judge_model,
+            )
+            scores.append(jr.overall)
+
+        results.append(
+            {
+                "ablation": "mmr",
+                "chunk_size": 1000,
+                "chunk_overlap": args.chunk_overlap,
+                "top_k": 4,
+                "fetch_k": args.mmr_fetch_k,
+                "mmr_lambda": lam,
+                "mean_overall": sum(scores) / len(scores),
+                "n": len(scores),
+            }
+        )
+        print(f"[mmr lambda={lam}] mean_overall={results[-1]['mean_overall']:.3f}")
+
     out = Path(args.output)
     out.parent.mkdir(parents=True, exist_ok=True)
     out.write_text(json.dumps(results, indent=2), encoding="utf-8")
@@ -0,0 +1,75 @@
+# evaluation/bench_chunker.py
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from rag.chunking import SEPARATORS, RecursiveChunker
+from rag.ingest import extract_text_from_pdf_path
+
+
+def _best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the native chunker against LangChain's splitter.")
+    p.add_argument("--pdf", default="data/CELEX_32016R0679_EN_TXT.pdf", help="PDF whose text is chunked")
+    p.add_argument("--scales", default="1,10,50", help="Comma-separated text repetitions (document size multipliers)")
+    p.add_argument("--chunk-size", type=int, default=1000)
+    p.add_argument("--chunk-overlap", type=int, default=200)
+    p.add_argument("--repeats", type=int, default=3)
+    p.add_argument("--output", default="evaluation/artifacts/bench_chunker.json")
+    args = p.parse_args()
+
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:  # only needed for the comparison
+        RecursiveCharacterTextSplitter = None
+        print("langchain_text_splitters not installed: timing the native chunker only.")
+
+    base = extract_text_from_pdf_path(Path(args.pdf))
+    native = RecursiveChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, separators=SEPARATORS)
+
+    results: List[Dict[str, Any]] = []
+    for scale in [int(x) for x in args.scales.split(",") if x.strip()]:
+        text = "\n".join([base] * scale)
+        ours = [c.text for c in native.split(text)]
+        row: Dict[str, Any] = {
+            "chars": len(text),
+            "chunks": len(ours),
+            "native_s": round(_best_of(lambda: native.split(text), args.repeats), 4),
+        }
+
+        if RecursiveCharacterTextSplitter is not None:
+            def lc_split():
+                # built per call, like the old rag.ingest.chunk_text
+                return RecursiveCharacterTextSplitter(
+                    chunk_size=args.chunk_size,
+                    chunk_overlap=args.chunk_overlap,
+                    separators=SEPARATORS,
+                ).split_text(text)
+
+            row["langchain_s"] = round(_best_of(lc_split, args.repeats), 4)
+            row["speedup"] = round(row["langchain_s"] / max(row["native_s"], 1e-9), 2)
+            row["identical_output"] = lc_split() == ours
+
+        results.append(row)
+        print(row)
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nSaved chunker benchmark to: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# evaluation/bench_lexical.py
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from dotenv import load_dotenv
+
+from rag.ingest import ingest_pdf_dir
+from rag.lexical import get_lexical_index
+from rag.retriever import retrieve
+from rag.store import VectorStoreConfig, physical_config
+
+
+def _latencies(fn: Callable[[str], Any], queries: List[str], repeats: int) -> Dict[str, float]:
+    times: List[float] = []
+    for _ in range(repeats):
+        for q in queries:
+            t0 = time.perf_counter()
+            fn(q)
+            times.append((time.perf_counter() - t0) * 1000.0)
+    times.sort()
+    return {
+        "p50_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[int(0.95 * (len(times) - 1))], 3),
+        "n": len(times),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark lexical (BM25 / exact-reference) vs dense retrieval latency.")
+    p.add_argument("--pdf-dir", default="data", help="Directory of PDFs to ingest (skipped if unchanged)")
+    p.add_argument("--dataset", default="evaluation/datasets/ci_golden.json", help="Questions for the free-text runs")
+    p.add_argument("--top-k", type=int, default=4)
+    p.add_argument("--repeats", type=int, default=5)
+    p.add_argument("--output", default="evaluation/artifacts/bench_lexical.json")
+    args = p.parse_args()
+    load_dotenv()
+
+    cfg = VectorStoreConfig()
+    ingest_pdf_dir(Path(args.pdf_dir), config=cfg)
+    pc = physical_config(cfg)
+    lex = get_lexical_index(pc.persist_path, pc.collection_name)
+    if lex is None:
+        raise SystemExit("No lexical index found (is LEXICAL_INDEX=0?).")
+
+    questions = [ex["question"] for ex in json.loads(Path(args.dataset).read_text(encoding="utf-8"))]
+    articles = sorted(int(r.split()[1]) for r in lex.refs if r.startswith("article "))
+    ref_questions = [f"What does Article {n} require?" for n in articles[:50]]
+
+    # Dense repeats hit the in-memory query-embedding cache after the first pass, so the
+    # first pass alone is reported as "cold" (includes the embedding round-trip).
+    results: Dict[str, Any] = {
+        "chunks": len(lex),
+        "vocab": len(lex.terms),
+        "dense_cold": _latencies(lambda q: retrieve(q, top_k=args.top_k, lexical=False), questions, 1),
+        "dense_warm": _latencies(lambda q: retrieve(q, top_k=args.top_k, lexical=False), questions, args.repeats),
+        "hybrid_warm": _latencies(lambda q: retrieve(q, top_k=args.top_k, lexical=True), questions, args.repeats),
+        "bm25_search": _latencies(lambda q: lex.search(q, 20), questions, args.repeats),
+        "reference_fast_path": _latencies(lambda q: retrieve(q, top_k=args.top_k), ref_questions, args.repeats),
+        "reference_dense": _latencies(lambda q: retrieve(q, top_k=args.top_k, lexical=False), ref_questions, 1),
+    }
+    for name, row in results.items():
+        print(f"{name}: {row}")
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nSaved lexical benchmark to: {out}")
+
+
+if __name__ == "__main__":
+    main()
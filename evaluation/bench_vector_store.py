@@ -0,0 +1,127 @@
+# evaluation/bench_vector_store.py
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def _random_unit(n: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((n, dim), dtype=np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _open_collection(backend: str, path: str):
+    if backend == "numpy":
+        from rag.numpy_store import NumpyCollection
+
+        return NumpyCollection(Path(path) / "numpy", "bench")
+
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    return client.get_or_create_collection(
+        name="bench",
+        embedding_function=None,
+        configuration={"hnsw": {"space": "cosine"}},
+    )
+
+
+def run_worker(backend: str, n: int, dim: int, queries: int, batch: int) -> Dict[str, Any]:
+    """
+    Runs in a fresh process so peak RSS belongs to one (backend, n) pair only.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        vecs = _random_unit(n, dim, seed=0)
+        ids = [f"doc-{i}" for i in range(n)]
+        docs = [f"chunk {i}" for i in range(n)]
+        metas = [{"source": "bench.pdf", "chunk_index": i} for i in range(n)]
+
+        t0 = time.perf_counter()
+        col = _open_collection(backend, tmp)
+        step = 5000  # below Chroma's max batch size
+        for i in range(0, n, step):
+            col.add(ids=ids[i : i + step], documents=docs[i : i + step],
+                    metadatas=metas[i : i + step], embeddings=vecs[i : i + step])
+        build_s = time.perf_counter() - t0
+        del vecs, col
+
+        qs = _random_unit(queries, dim, seed=1)
+
+        # Cold start: open the persisted index and answer one query.
+        t0 = time.perf_counter()
+        col = _open_collection(backend, tmp)
+        col.query(query_embeddings=qs[:1], n_results=4)
+        cold_ms = (time.perf_counter() - t0) * 1000.0
+
+        single: List[float] = []
+        for q in qs:
+            t0 = time.perf_counter()
+            col.query(query_embeddings=q[None, :], n_results=4)
+            single.append((time.perf_counter() - t0) * 1000.0)
+
+        t0 = time.perf_counter()
+        col.query(query_embeddings=qs[:batch], n_results=4)
+        batch_ms = (time.perf_counter() - t0) * 1000.0
+
+    single.sort()
+    return {
+        "backend": backend,
+        "n": n,
+        "dim": dim,
+        "build_s": round(build_s, 3),
+        "cold_open_query_ms": round(cold_ms, 2),
+        "query_p50_ms": round(statistics.median(single), 3),
+        "query_p95_ms": round(single[int(0.95 * (len(single) - 1))], 3),
+        f"batch{batch}_ms": round(batch_ms, 2),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark Chroma vs the NumPy vector backend (latency + RSS).")
+    p.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated corpus sizes")
+    p.add_argument("--backends", default="chroma,numpy")
+    p.add_argument("--dim", type=int, default=1536, help="Embedding dimension (text-embedding-3-small = 1536)")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--batch", type=int, default=32, help="Queries per batch-query measurement")
+    p.add_argument("--output", default="evaluation/artifacts/bench_vector_store.json")
+    p.add_argument("--worker", nargs=2, metavar=("BACKEND", "N"), help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.worker:
+        backend, n = args.worker
+        print(json.dumps(run_worker(backend, int(n), args.dim, args.queries, args.batch)))
+        return
+
+    results = []
+    for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            out = subprocess.run(
+                [sys.executable, "-m", "evaluation.bench_vector_store", "--worker", backend, str(n),
+                 "--dim", str(args.dim), "--queries", str(args.queries), "--batch", str(args.batch)],
+                check=True, capture_output=True, text=True,
+            )
+            row = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(row)
+            print(row)
+
+    path = Path(args.output)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nSaved benchmark results to: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from evaluation.judge import judge_answer
-from rag.retriever import format_context, Chunk
+from rag.retriever import format_context, retrieve_many, Chunk
 from rag.generator import answer_question
 
 
@@ -41,6 +41,11 @@ def main():
     data = load_json_list(dataset_path)
     rows: List[Dict[str, Any]] = []
 
+    # nightly: retrieve for the whole dataset in one batched round-trip
+    retrieved: List[List[Chunk]] = []
+    if args.mode == "nightly":
+        retrieved = retrieve_many([ex["question"] for ex in data], top_k=args.top_k)
+
     for i, ex in enumerate(data, start=1):
         print(f"Evaluating example {data}..")
         ex_id = ex.get("id", f"ex{i}")
@@ -57,7 +62,7 @@ def main():
             retrieved_debug = ex.get("retrieved_chunks", [])
         else:
             # nightly: run end-to-end RAG (retrieval+generation)
-            rag = answer_question(q, top_k=args.top_k)
+            rag = answer_question(q, top_k=args.top_k, chunks=retrieved[i - 1])
             answer = rag.answer
             context = format_context(rag.chunks)
             retrieved_debug = [
@@ -2,11 +2,10 @@
 from __future__ import annotations
 
 import json
-import os
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
-from openai import OpenAI
+from rag.openai_client import chat_completion
 
 
 JUDGE_SYSTEM_PROMPT = """You are an expert evaluator of answers produced by a Retrieval-Augmented Generation (RAG) system.
@@ -64,13 +63,6 @@ class JudgeResult:
         )
 
 
-def _client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing OPENAI_API_KEY.")
-    return OpenAI(api_key=api_key)
-
-
 def _extract_json(text: str) -> Dict[str, Any]:
     """
     Robust JSON extraction: handles accidental surrounding text.
@@ -116,12 +108,12 @@ Retrieved context excerpts:
 {context}
 """
 
-    client = _client()
     last_err: Optional[Exception] = None
 
     for _ in range(max_retries + 1):
         try:
-            resp = client.chat.completions.create(
+            # transport errors (429/5xx) are retried inside chat_completion; this loop is for bad JSON
+            resp = chat_completion(
                 model=model,
                 messages=[
                     {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import List, Dict, Any
 
 from rag.generator import answer_question
+from rag.retriever import retrieve_many
 
 
 def load_json_list(path: Path) -> List[Dict[str, Any]]:
@@ -33,12 +34,15 @@ def main():
 
     golden: List[Dict[str, Any]] = []
 
+    # one batched retrieval round-trip for all picked questions
+    retrieved = retrieve_many([ex["question"] for ex in picked], top_k=args.top_k)
+
     for i, ex in enumerate(picked, start=1):
         q = ex["question"]
         ideal = ex.get("ideal_answer")
         ctx = ex.get("context", "")
 
-        rag = answer_question(question=q, top_k=args.top_k)
+        rag = answer_question(question=q, top_k=args.top_k, chunks=retrieved[i - 1])
 
         golden.append(
             {
@@ -47,9 +51,12 @@ def main():
                 "context": ctx,
                 "ideal_answer": ideal,
                 # golden baseline output:
-                "golden_rag_answer": rag["rag_answer"],
+                "golden_rag_answer": rag.answer,
                 # keep retrieval for debugging:
-                "retrieved_chunks": rag["retrieved_chunks"],
+                "retrieved_chunks": [
+                    {"id": c.id, "source": c.source, "chunk_index": c.chunk_index, "distance": c.distance}
+                    for c in rag.chunks
+                ],
             }
         )
 
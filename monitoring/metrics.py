@@ -5,7 +5,7 @@ import sys
 import time
 import hashlib
 from dataclasses import dataclass, asdict
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 
 def _now_iso() -> str:
@@ -27,15 +27,32 @@ class InferenceMetric:
     question_sha1: str
 
     top_k: int
-    num_chunks: int
+    chosen_k: int  # chunks actually used (< top_k with adaptive retrieval)
+    num_chunks: int  # chunks passed to the LLM, with or without a distance
     mean_distance: Optional[float]
     min_distance: Optional[float]
     max_distance: Optional[float]
 
     cited: bool
     refusal: bool
+    short_circuit: bool  # refused from retrieval distances alone, no LLM call
+    cache_hit: bool  # answer served from the answer cache, no LLM call
+    coalesced: bool  # waited for an identical in-flight request and shared its answer
 
     latency_ms: int
+    ttft_ms: Optional[int]  # time to first answer token (streaming only), from request start
+
+    # per-stage latency; None = stage didn't run (chunks passed in, cached/short-circuited answer)
+    embed_ms: Optional[float]       # query embedding (cache lookups included)
+    search_ms: Optional[float]      # lexical lookups + vector store query + fusion
+    format_ms: Optional[float]      # context packing + prompt building
+    llm_ttft_ms: Optional[float]    # LLM request -> first token (streaming only)
+    llm_ms: Optional[float]         # LLM request -> last token
+
+    # token usage reported by the API and its estimated price
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    cost_usd: Optional[float]
 
     # optional extra metadata
     source: str = "rag"            # e.g. "rag", "agent", "api"
@@ -71,15 +88,60 @@ class MetricsLogger:
                 f.write(line + "\n")
 
 
+# USD per 1M tokens (input, output). Model names are matched by longest prefix, so dated
+# snapshots ("gpt-4.1-mini-2025-04-14") use their family price. Extend/override with
+# LLM_PRICES_JSON='{"my-model": [0.5, 1.5]}'.
+MODEL_PRICES_PER_1M: Dict[str, Tuple[float, float]] = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+MODEL_PRICES_PER_1M.update(
+    {k: (float(v[0]), float(v[1])) for k, v in json.loads(os.getenv("LLM_PRICES_JSON", "{}")).items()}
+)
+
+
+def estimate_cost_usd(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+    """
+    Estimated price of one call, or None if the model (or the usage) is unknown.
+    """
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    matches = [name for name in MODEL_PRICES_PER_1M if (model or "").startswith(name)]
+    if not matches:
+        return None
+    price_in, price_out = MODEL_PRICES_PER_1M[max(matches, key=len)]
+    return round(((prompt_tokens or 0) * price_in + (completion_tokens or 0) * price_out) / 1_000_000, 8)
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(float(value), 3)
+
+
 def make_metric(
     *,
     request_id: str,
     question: str,
     top_k: int,
     distances: list[float],
+    chosen_k: Optional[int] = None,
+    num_chunks: Optional[int] = None,
     cited: bool,
     refusal: bool,
     latency_ms: int,
+    ttft_ms: Optional[int] = None,
+    embed_ms: Optional[float] = None,
+    search_ms: Optional[float] = None,
+    format_ms: Optional[float] = None,
+    llm_ttft_ms: Optional[float] = None,
+    llm_ms: Optional[float] = None,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    short_circuit: bool = False,
+    cache_hit: bool = False,
+    coalesced: bool = False,
     source: str = "rag",
     model: str = "",
     collection: str = "",
@@ -94,13 +156,26 @@ def make_metric(
         question_len=len(question or ""),
         question_sha1=_sha1(question or ""),
         top_k=top_k,
-        num_chunks=len(d_sorted),
+        chosen_k=len(d_sorted) if chosen_k is None else chosen_k,
+        num_chunks=len(d_sorted) if num_chunks is None else num_chunks,
         mean_distance=mean_d,
         min_distance=d_sorted[0] if d_sorted else None,
         max_distance=d_sorted[-1] if d_sorted else None,
         cited=cited,
         refusal=refusal,
+        short_circuit=short_circuit,
+        cache_hit=cache_hit,
+        coalesced=coalesced,
         latency_ms=int(latency_ms),
+        ttft_ms=None if ttft_ms is None else int(ttft_ms),
+        embed_ms=_ms(embed_ms),
+        search_ms=_ms(search_ms),
+        format_ms=_ms(format_ms),
+        llm_ttft_ms=_ms(llm_ttft_ms),
+        llm_ms=_ms(llm_ms),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost_usd=estimate_cost_usd(model, prompt_tokens, completion_tokens),
         source=source,
         model=model,
         collection=collection,
@@ -0,0 +1,200 @@
+# rag/answer_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from rag.manifest import manifest_path
+from rag.store import VectorStoreConfig, physical_config
+
+# In-memory LRU of generated answers (0 disables the cache), entries expire after the TTL.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+# Optional SQLite tier shared across processes/restarts (empty path = memory only).
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+
+
+def index_version(config: VectorStoreConfig = VectorStoreConfig()) -> Tuple[str, str]:
+    """
+    (scope, version) of the live index. The manifest is rewritten by every ingest that
+    changes chunks and deleted by a reset, so its mtime changes whenever answers may.
+    In blue/green mode the physical collection name changes on promotion as well.
+    """
+    pc = physical_config(config)
+    try:
+        mtime = str(manifest_path(pc.persist_path, pc.collection_name).stat().st_mtime_ns)
+    except FileNotFoundError:
+        mtime = "empty"
+    scope = f"{config.persist_path}|{config.collection_name}"
+    return scope, f"{pc.collection_name}@{mtime}"
+
+
+def normalize_question(question: str) -> str:
+    # Unlike query embeddings, the answer doesn't depend on casing/spacing of the question.
+    return " ".join((question or "").split()).casefold()
+
+
+def answer_cache_key(
+    *,
+    question: str,
+    chunk_ids: Sequence[str],
+    model: str,
+    temperature: float,
+    prompt_hash: str,
+    version: str,
+) -> str:
+    payload = [normalize_question(question), list(chunk_ids), model, float(temperature), prompt_hash, version]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Two-tier cache of answer texts: a thread-safe in-memory LRU with a TTL, backed by
+    an optional SQLite file. Keys come from answer_cache_key(); entries are tagged with
+    the index scope/version so stale ones are purged as soon as a new version shows up.
+    """
+
+    def __init__(self, *, max_size: int = 512, ttl_s: float = 86400.0, path: str = "") -> None:
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.purged = 0
+        self._data: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()  # key -> (ts, scope, text)
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers(scope, version)")
+            self._conn.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _expired(self, ts: float) -> bool:
+        return self.ttl_s > 0 and time.time() - ts >= self.ttl_s
+
+    def _check_version_locked(self, scope: str, version: str) -> None:
+        if self._versions.get(scope) == version:
+            return
+        # Collection was reset/re-ingested (or first use): drop what belongs to older versions.
+        if scope in self._versions:
+            stale = [k for k, (_, s, _) in self._data.items() if s == scope]
+            for k in stale:
+                del self._data[k]
+            self.purged += len(stale)
+        if self._conn is not None:
+            cur = self._conn.execute("DELETE FROM answers WHERE scope = ? AND version != ?", (scope, version))
+            self._conn.commit()
+            self.purged += cur.rowcount
+        self._versions[scope] = version
+
+    def get(self, key: str, *, scope: str, version: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_version_locked(scope, version)
+            item = self._data.get(key)
+            if item is not None and not self._expired(item[0]):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[2]
+            if item is not None:
+                del self._data[key]  # expired
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._put_memory_locked(key, scope, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def _put_memory_locked(self, key: str, scope: str, text: str, ts: float) -> None:
+        self._data[key] = (ts, scope, text)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def put(self, key: str, text: str, *, scope: str, version: str) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._check_version_locked(scope, version)
+            self._put_memory_locked(key, scope, text, now)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, scope, version, answer, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, scope, version, text, now),
+                )
+                self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM answers")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "purged": self.purged,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_CACHE: Optional[AnswerCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    The process-wide answer cache (configured from ANSWER_CACHE_* env vars).
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = AnswerCache(max_size=ANSWER_CACHE_SIZE, ttl_s=ANSWER_CACHE_TTL_S, path=ANSWER_CACHE_PATH)
+        return _CACHE
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    return get_answer_cache().stats()
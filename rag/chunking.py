@@ -0,0 +1,275 @@
+# rag/chunking.py
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+SEPARATORS = ["\n\n", "\n", "Article ", ".", " ", ""]
+
+Span = Tuple[int, int]
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with OpenAI tokenizers; good enough for batching/budgets.
+    return max(1, len(text) // 4)
+
+
+@dataclass(frozen=True)
+class TextChunk:
+    """
+    A chunk plus where it came from: [start, end) character offsets into the
+    document text ("\\n".join(pages)) and the 1-based PDF pages it spans.
+    """
+    text: str
+    start: int
+    end: int
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+
+class RecursiveChunker:
+    """
+    Offset-tracking re-implementation of LangChain's RecursiveCharacterTextSplitter
+    (keep_separator="start", strip_whitespace=True, len() as length).
+
+    Works on (start, end) spans over the original string instead of copying
+    substrings around, so every chunk comes with exact character offsets.
+    """
+
+    def __init__(
+        self,
+        *,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        separators: Sequence[str] = SEPARATORS,
+    ) -> None:
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if chunk_overlap < 0 or chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap must be in [0, chunk_size], got {chunk_overlap}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+
+    def split_spans(self, text: str) -> List[Span]:
+        """
+        Returns raw (unstripped) [start, end) spans of the chunks, in order.
+        """
+        return self._split(text, 0, len(text), self.separators)
+
+    def split(self, text: str) -> List[TextChunk]:
+        out: List[TextChunk] = []
+        for a, b in self.split_spans(text):
+            stripped = _strip_span(text, a, b)
+            if stripped is not None:
+                out.append(TextChunk(text=text[stripped[0] : stripped[1]], start=stripped[0], end=stripped[1]))
+        return out
+
+    def _split(self, text: str, start: int, end: int, separators: Sequence[str]) -> List[Span]:
+        separator = separators[-1]
+        rest: Sequence[str] = []
+        for i, sep in enumerate(separators):
+            if not sep:
+                separator = sep
+                break
+            if text.find(sep, start, end) != -1:
+                separator = sep
+                rest = separators[i + 1 :]
+                break
+
+        final: List[Span] = []
+        good: List[Span] = []
+        for a, b in _pieces(text, start, end, separator):
+            if b - a < self.chunk_size:
+                good.append((a, b))
+                continue
+            if good:
+                final.extend(self._merge(good))
+                good = []
+            if rest:
+                final.extend(self._split(text, a, b, rest))
+            else:
+                final.append((a, b))
+        if good:
+            final.extend(self._merge(good))
+        return final
+
+    def _merge(self, pieces: List[Span]) -> List[Span]:
+        merger = _Merger(self.chunk_size, self.chunk_overlap)
+        docs = [d for d in (merger.add(a, b) for a, b in pieces) if d is not None]
+        last = merger.flush()
+        if last is not None:
+            docs.append(last)
+        return docs
+
+
+class _Merger:
+    """
+    Incremental form of the splitter's merge step: pieces go in one at a time and a
+    chunk comes out whenever the next piece no longer fits. Pieces are contiguous,
+    so a merged chunk is just (first start, last end).
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.current: deque = deque()
+        self.total = 0
+
+    def add(self, a: int, b: int) -> Optional[Span]:
+        n = b - a
+        done = None
+        if self.total + n > self.chunk_size and self.current:
+            done = (self.current[0][0], self.current[-1][1])
+            while self.total > self.chunk_overlap or (self.total + n > self.chunk_size and self.total > 0):
+                pa, pb = self.current.popleft()
+                self.total -= pb - pa
+        self.current.append((a, b))
+        self.total += n
+        return done
+
+    def flush(self) -> Optional[Span]:
+        if not self.current:
+            return None
+        done = (self.current[0][0], self.current[-1][1])
+        self.current.clear()
+        self.total = 0
+        return done
+
+
+def _pieces(text: str, start: int, end: int, separator: str) -> Iterator[Span]:
+    # Separator stays at the start of the following piece (keep_separator="start").
+    if not separator:
+        for i in range(start, end):
+            yield (i, i + 1)
+        return
+    prev = start
+    pos = text.find(separator, start, end)
+    while pos != -1:
+        if pos > prev:
+            yield (prev, pos)
+        prev = pos
+        pos = text.find(separator, pos + len(separator), end)
+    if end > prev:
+        yield (prev, end)
+
+
+def _strip_span(text: str, a: int, b: int) -> Optional[Span]:
+    seg = text[a:b]
+    left = seg.lstrip()
+    if not left:
+        return None
+    a2 = a + (len(seg) - len(left))
+    return (a2, a2 + len(left.rstrip()))
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[int, str]],
+    *,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    separators: Sequence[str] = SEPARATORS,
+) -> Iterator[TextChunk]:
+    """
+    Streams chunks of "\\n".join(page texts) with document offsets and page numbers.
+    The chunks are exactly RecursiveChunker.split() of the joined text (= chunk_text()).
+
+    `pages` yields (page_number, text). The splitter picks its top-level separator from
+    the whole text, and that choice is only final once the first separator in the list
+    has been seen; until then pages are buffered. From there on, every piece that is
+    closed by the next separator goes through the same merge step as in split(), and
+    only text still needed by the open chunk or piece is kept.
+    """
+    chunker = RecursiveChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=separators)
+    top, rest = separators[0], list(separators[1:])
+    merger = _Merger(chunk_size, chunk_overlap)
+
+    page_offsets: List[int] = []  # document offset where each page starts
+    page_numbers: List[int] = []
+    buffer = ""
+    base = 0  # document offset of buffer[0]
+    doc_len = 0
+    locked = top == ""  # top-level separator known for the whole document
+    prev = 0  # document offset where the open piece starts
+    scan = 0  # document offset to search the next separator from
+
+    def emit(spans: Iterable[Span]) -> Iterator[TextChunk]:
+        # spans are document offsets
+        for a, b in spans:
+            stripped = _strip_span(buffer, a - base, b - base)
+            if stripped is None:
+                continue
+            s, e = stripped[0] + base, stripped[1] + base
+            yield TextChunk(
+                text=buffer[stripped[0] : stripped[1]],
+                start=s,
+                end=e,
+                page_start=page_numbers[bisect_right(page_offsets, s) - 1],
+                page_end=page_numbers[bisect_right(page_offsets, e - 1) - 1],
+            )
+
+    def piece(a: int, b: int) -> Iterator[TextChunk]:
+        # Same as one iteration of RecursiveChunker._split at the top level.
+        if b - a < chunk_size:
+            done = merger.add(a, b)
+            if done is not None:
+                yield from emit([done])
+            return
+        done = merger.flush()
+        if done is not None:
+            yield from emit([done])
+        if rest:
+            sub = chunker._split(buffer, a - base, b - base, rest)
+            yield from emit((x + base, y + base) for x, y in sub)
+        else:
+            yield from emit([(a, b)])
+
+    def closed_pieces() -> Iterator[TextChunk]:
+        nonlocal prev, scan
+        if top == "":
+            for i in range(prev, doc_len):
+                yield from piece(i, i + 1)
+            prev = scan = doc_len
+            return
+        pos = buffer.find(top, scan - base)
+        while pos != -1:
+            pos += base
+            if pos > prev:
+                yield from piece(prev, pos)
+            prev = pos
+            scan = pos + len(top)
+            pos = buffer.find(top, scan - base)
+
+    for number, page in pages:
+        added_at = len(buffer)
+        if page_offsets:
+            buffer += "\n"
+            doc_len += 1
+        page_offsets.append(doc_len)
+        page_numbers.append(number)
+        buffer += page
+        doc_len += len(page)
+
+        if not locked:
+            locked = buffer.find(top, max(0, added_at - len(top) + 1)) != -1
+            if not locked:
+                continue
+        yield from closed_pieces()
+
+        keep = min(prev, merger.current[0][0]) if merger.current else prev
+        if keep > base:
+            buffer = buffer[keep - base :]
+            base = keep
+
+    if not locked:
+        # The first separator never showed up: the splitter picks another one for the whole text.
+        yield from emit(chunker.split_spans(buffer))
+        return
+    yield from closed_pieces()
+    if doc_len > prev:
+        yield from piece(prev, doc_len)
+    done = merger.flush()
+    if done is not None:
+        yield from emit([done])
@@ -0,0 +1,157 @@
+# rag/context.py
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from rag.chunking import estimate_tokens
+
+if TYPE_CHECKING:
+    from rag.retriever import Chunk
+
+# Upper bound for the context block sent to the LLM (estimated tokens). 0 disables the limit.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+
+
+@dataclass(frozen=True)
+class ContextBlock:
+    """
+    One cited passage: a run of neighbouring chunks (same source, consecutive
+    chunk_index) merged with their overlap removed.
+    """
+    citation: int
+    chunk_ids: List[str]
+    source: Optional[str]
+    chunk_indices: List[Optional[int]]
+    text: str
+    tokens: int
+
+
+@dataclass(frozen=True)
+class PackedContext:
+    text: str
+    blocks: List[ContextBlock]
+
+    @property
+    def tokens(self) -> int:
+        return sum(b.tokens for b in self.blocks)
+
+    def citation_map(self) -> Dict[int, List[str]]:
+        """
+        [n] -> ids of the chunks behind that citation.
+        """
+        return {b.citation: list(b.chunk_ids) for b in self.blocks}
+
+
+def _offsets(chunk: "Chunk") -> Optional[tuple]:
+    start, end = chunk.metadata.get("start_char"), chunk.metadata.get("end_char")
+    if isinstance(start, int) and isinstance(end, int):
+        return start, end
+    return None
+
+
+def _suffix_prefix_overlap(a: str, b: str, min_len: int = 16) -> int:
+    # Fallback for chunks ingested before offsets were stored: longest suffix of a == prefix of b.
+    # Very short matches are usually coincidence ("e", "the"), not the splitter's overlap.
+    for k in range(min(len(a), len(b)), min_len - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _merge_run(run: List["Chunk"]) -> str:
+    text = run[0].text
+    prev = run[0]
+    for ch in run[1:]:
+        a, b = _offsets(prev), _offsets(ch)
+        if a is not None and b is not None:
+            overlap = max(0, a[1] - b[0])
+        else:
+            overlap = _suffix_prefix_overlap(text, ch.text)
+        sep = "" if overlap else "\n"  # whitespace stripped between the chunks is gone
+        if overlap < len(ch.text):
+            text += sep + ch.text[overlap:]
+            prev = ch
+    return text
+
+
+def _runs(chunks: Sequence["Chunk"]) -> List[List[int]]:
+    """
+    Groups chunk positions into runs of neighbours, ordered by the best-ranked member.
+    """
+    by_source: Dict[Optional[str], List[int]] = {}
+    for pos, ch in enumerate(chunks):
+        by_source.setdefault(ch.source, []).append(pos)
+
+    runs: List[List[int]] = []
+    for positions in by_source.values():
+        indexed = sorted(
+            (p for p in positions if isinstance(chunks[p].chunk_index, int)),
+            key=lambda p: chunks[p].chunk_index,
+        )
+        current: List[int] = []
+        for p in indexed:
+            if current and chunks[p].chunk_index == chunks[current[-1]].chunk_index:
+                continue  # same chunk retrieved twice
+            if current and chunks[p].chunk_index != chunks[current[-1]].chunk_index + 1:
+                runs.append(current)
+                current = []
+            current.append(p)
+        if current:
+            runs.append(current)
+        runs.extend([p] for p in positions if not isinstance(chunks[p].chunk_index, int))
+
+    runs.sort(key=min)
+    return runs
+
+
+def pack_context(
+    chunks: Sequence["Chunk"],
+    *,
+    max_tokens: Optional[int] = None,
+    label: str = "rank",
+) -> PackedContext:
+    """
+    Builds the LLM context from retrieved chunks:
+    - neighbouring chunks of the same source are merged and their overlap dropped,
+    - blocks are kept in retrieval order (best chunk first) while they fit in `max_tokens`
+      (default CONTEXT_MAX_TOKENS; 0 = no limit); the first block is truncated if needed,
+    - each block gets one citation: 1, 2, ... (label="rank") or the chunk_index of its
+      first chunk (label="chunk_index", as the agent cites).
+
+    The same chunks always give the same text and citations.
+    """
+    budget = CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+
+    blocks: List[ContextBlock] = []
+    used = 0
+    for run in _runs(chunks):
+        members = [chunks[p] for p in run]
+        text = _merge_run(members)
+        tokens = estimate_tokens(text)
+        if budget > 0 and used + tokens > budget:
+            if blocks:
+                continue  # a smaller block further down may still fit
+            text = text[: budget * 4]
+            tokens = estimate_tokens(text)
+
+        if label == "chunk_index" and members[0].chunk_index is not None:
+            citation = int(members[0].chunk_index)
+        else:
+            citation = len(blocks) + 1
+        blocks.append(
+            ContextBlock(
+                citation=citation,
+                chunk_ids=[c.id for c in members],
+                source=members[0].source,
+                chunk_indices=[c.chunk_index for c in members],
+                text=text,
+                tokens=tokens,
+            )
+        )
+        used += tokens
+
+    if not blocks:
+        return PackedContext(text="No relevant context found.", blocks=[])
+    return PackedContext(text="\n\n".join(f"[{b.citation}] {b.text}" for b in blocks), blocks=blocks)
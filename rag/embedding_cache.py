@@ -0,0 +1,188 @@
+# rag/embedding_cache.py
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from chromadb.api.types import Documents, Embeddings
+from chromadb.utils import embedding_functions
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store keyed by (embedding_model, sha256(text)).
+
+    Vectors are stored as raw float32 blobs in SQLite. When the table grows past
+    `max_entries`, the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, *, max_entries: int = 200_000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_sha256 TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_sha256)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(dict.fromkeys(hashes))
+        found: Dict[str, np.ndarray] = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            # SQLite caps bound parameters; query in slices.
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_sha256, vector FROM embeddings WHERE model = ? AND text_sha256 IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_sha256 = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for h, vec in items.items():
+            arr = np.asarray(vec, dtype=np.float32)
+            rows.append((model, h, int(arr.shape[0]), arr.tobytes(), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_sha256, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        if self.max_entries <= 0:
+            return
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = n - self.max_entries
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?
+            )
+            """,
+            (overflow,),
+        )
+        self.evictions += overflow
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            total = self.hits + self.misses
+            return {
+                "entries": n,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_CACHES: Dict[str, EmbeddingCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_embedding_cache(path: str, *, max_entries: int = 200_000) -> EmbeddingCache:
+    """
+    Returns the process-wide cache for `path` (one SQLite connection per file).
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            cache = EmbeddingCache(path, max_entries=max_entries)
+            _CACHES[path] = cache
+        return cache
+
+
+class CachedOpenAIEmbeddingFunction(embedding_functions.OpenAIEmbeddingFunction):
+    """
+    OpenAIEmbeddingFunction that only sends texts it has never embedded before.
+
+    Subclassing (instead of wrapping) keeps Chroma's persisted embedding-function
+    name/config ("openai") unchanged, so existing collections open as before.
+    """
+
+    def __init__(self, *, cache: EmbeddingCache, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not input:
+            return []
+
+        hashes = [text_sha256(t) for t in input]
+        found = self.cache.get_many(self.model_name, hashes)
+
+        # Embed each missing text once, even if it repeats inside the batch.
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, input):
+            if h not in found and h not in missing:
+                missing[h] = t
+
+        if missing:
+            fresh = super().__call__(list(missing.values()))
+            new_items = {h: np.asarray(v, dtype=np.float32) for h, v in zip(missing.keys(), fresh)}
+            self.cache.put_many(self.model_name, new_items)
+            found.update(new_items)
+
+        return [found[h] for h in hashes]
+
+
+def cache_stats(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Stats for every open cache (or just `path`).
+    """
+    with _CACHES_LOCK:
+        caches: List[EmbeddingCache] = [c for p, c in _CACHES.items() if path is None or p == path]
+    return {c.path: c.stats() for c in caches}
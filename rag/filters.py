@@ -0,0 +1,115 @@
+# rag/filters.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Union
+
+
+@dataclass(frozen=True)
+class RetrievalFilter:
+    """
+    Restricts retrieval to part of the collection; all fields that are set are ANDed.
+
+    `where` takes extra predicates in Chroma's syntax, e.g.
+    {"page_start": {"$gte": 10}} or {"$or": [{"source": "a.pdf"}, {"source": "b.pdf"}]}.
+    """
+    source: Optional[Union[str, Sequence[str]]] = None
+    chunk_index_min: Optional[int] = None  # inclusive
+    chunk_index_max: Optional[int] = None  # inclusive
+    where: Optional[Dict[str, Any]] = None
+
+    def sources(self) -> Optional[List[str]]:
+        if self.source is None:
+            return None
+        if isinstance(self.source, str):
+            return [self.source]
+        return list(self.source)
+
+    def to_where(self) -> Optional[Dict[str, Any]]:
+        """
+        The filter as a Chroma `where` clause (None = no filter).
+        """
+        clauses: List[Dict[str, Any]] = []
+        sources = self.sources()
+        if sources is not None:
+            clauses.append({"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}})
+        if self.chunk_index_min is not None:
+            clauses.append({"chunk_index": {"$gte": int(self.chunk_index_min)}})
+        if self.chunk_index_max is not None:
+            clauses.append({"chunk_index": {"$lte": int(self.chunk_index_max)}})
+        if self.where:
+            clauses.append(self.where)
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+_OPS = {
+    "$eq": lambda v, x: v == x,
+    "$ne": lambda v, x: v != x,
+    "$gt": lambda v, x: v > x,
+    "$gte": lambda v, x: v >= x,
+    "$lt": lambda v, x: v < x,
+    "$lte": lambda v, x: v <= x,
+    "$in": lambda v, x: v in x,
+    "$nin": lambda v, x: v not in x,
+}
+
+
+def where_matches(where: Optional[Dict[str, Any]], metadata: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluates a Chroma-style `where` clause against one chunk's metadata
+    (for backends without native filtering). Missing fields never match.
+    """
+    if not where:
+        return True
+    meta = metadata or {}
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(where_matches(c, meta) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(where_matches(c, meta) for c in cond):
+                return False
+        elif key not in meta:
+            return False
+        elif isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op not in _OPS:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                try:
+                    if not _OPS[op](meta[key], arg):
+                        return False
+                except TypeError:  # e.g. comparing a str field with a number
+                    return False
+        elif meta[key] != cond:
+            return False
+    return True
+
+
+def where_sources(where: Optional[Dict[str, Any]]) -> Optional[Set[Any]]:
+    """
+    The set of sources a clause is restricted to (top level or inside a top-level $and),
+    or None if it can match any source. Lets backends skip other documents up front.
+    """
+    if not where:
+        return None
+    found: Optional[Set[Any]] = None
+    for key, cond in where.items():
+        allowed: Optional[Set[Any]] = None
+        if key == "$and":
+            for c in cond:
+                sub = where_sources(c)
+                if sub is not None:
+                    allowed = sub if allowed is None else allowed & sub
+        elif key == "source":
+            if not isinstance(cond, dict):
+                allowed = {cond}
+            elif "$eq" in cond:
+                allowed = {cond["$eq"]}
+            elif "$in" in cond:
+                allowed = set(cond["$in"])
+        if allowed is not None:
+            found = allowed if found is None else found & allowed
+    return found
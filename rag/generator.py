@@ -1,17 +1,22 @@
 # rag/generator.py
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
 import time
 import uuid
 import re
-from dataclasses import dataclass
-from typing import List
-
-from openai import OpenAI
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from rag.prompts import RAG_SYSTEM_PROMPT, RAG_USER_PROMPT_TEMPLATE
-from rag.retriever import Chunk, retrieve, format_context
+from rag.answer_cache import answer_cache_key, answer_cache_stats, get_answer_cache, index_version, normalize_question
+from rag.context import PackedContext, pack_context
+from rag.filters import RetrievalFilter
+from rag.retriever import Chunk, retrieve, retrieve_async, query_cache_stats
+from rag.openai_client import chat_completion, chat_completion_async, openai_client_stats
+from rag.singleflight import AsyncSingleFlight, SingleFlight, flight_key
 
 from monitoring.metrics import MetricsLogger, make_metric
 
@@ -21,19 +26,37 @@ REFUSAL_EXACT = "The provided context does not contain enough information to ans
 
 _METRICS = MetricsLogger()
 
+# Part of the answer-cache key: editing the prompts must not serve answers produced by the old ones.
+_PROMPT_HASH = hashlib.sha256(
+    f"{RAG_SYSTEM_PROMPT}\x00{RAG_USER_PROMPT_TEMPLATE}".encode("utf-8")
+).hexdigest()[:16]
+
+
+def _env_distance(name: str) -> Optional[float]:
+    raw = os.getenv(name, "").strip()
+    return float(raw) if raw else None
+
+
+# Retrieval-confidence gate: refuse without calling the LLM when the best (min) or the
+# average retrieved distance is above these ceilings. Distances are cosine distances
+# (1 - cos, 0..2) on every backend, see rag.store.distance_space. Unset = disabled;
+# calibrate on ci_unanswerable.json vs the answerable set before turning it on.
+REFUSAL_GATE_MIN_DISTANCE = _env_distance("RAG_REFUSAL_MIN_DISTANCE")
+REFUSAL_GATE_MEAN_DISTANCE = _env_distance("RAG_REFUSAL_MEAN_DISTANCE")
+
+# Concurrent identical questions (same normalized text/params) share one retrieval + LLM call.
+SINGLE_FLIGHT_ENABLED = os.getenv("RAG_SINGLE_FLIGHT", "1") == "1"
+_FLIGHTS = SingleFlight()
+_ASYNC_FLIGHTS = AsyncSingleFlight()
+
 
 @dataclass(frozen=True)
 class RAGAnswer:
     question: str
     answer: str
     chunks: List[Chunk]  # retrieved chunks used
-
-
-def _get_openai_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing OPENAI_API_KEY in environment.")
-    return OpenAI(api_key=api_key)
+    citations: Dict[int, List[str]] = field(default_factory=dict)  # [n] -> chunk ids
+    coalesced: bool = False  # shared from a concurrent identical request
 
 
 _CITATION_RE = re.compile(r"\[\d+\]")  # matches [1], [2], ...
@@ -43,51 +66,96 @@ def _has_citations(text: str) -> bool:
     return bool(_CITATION_RE.search(text or ""))
 
 
-def answer_question(
-    question: str,
-    *,
-    top_k: int = 4,
-    model: str = "gpt-4.1-mini",
-    temperature: float = 0.2,
-) -> RAGAnswer:
+def _distances(chunks: List[Chunk]) -> List[float]:
+    distances = []
+    for c in chunks:
+        # Chunk is yours; assume it has .distance (as shown in your earlier prints)
+        d = getattr(c, "distance", None)
+        if isinstance(d, (int, float)):
+            distances.append(float(d))
+    return distances
+
+
+def _should_short_circuit(chunks: List[Chunk]) -> bool:
     """
-    End-to-end: retrieve context -> ask LLM -> return answer with citations.
-    Also logs request-level metrics (latency, retrieval distances, refusal/citations).
+    True if retrieval is too weak to be worth an LLM call (the answer would be REFUSAL_EXACT).
     """
-    request_id = str(uuid.uuid4())[:8]
-    t0 = time.perf_counter()
+    if not chunks:
+        return True
+    distances = _distances(chunks)
+    if not distances:
+        # Exact-reference hits (retrieval fast path) or hand-built chunks: no distance to judge,
+        # and a literal "Article N" match is a strong signal anyway, so let the model decide.
+        return False
+    if REFUSAL_GATE_MIN_DISTANCE is not None and min(distances) > REFUSAL_GATE_MIN_DISTANCE:
+        return True
+    if REFUSAL_GATE_MEAN_DISTANCE is not None and sum(distances) / len(distances) > REFUSAL_GATE_MEAN_DISTANCE:
+        return True
+    return False
 
-    # 1) Retrieve
-    chunks = retrieve(question, top_k=top_k)
-    context = format_context(chunks)
 
-    # 2) Generate
-    user_prompt = RAG_USER_PROMPT_TEMPLATE.format(context=context, question=question)
+_CacheSlot = Tuple[str, str, str]  # (key, index scope, index version)
+
 
-    client = _get_openai_client()
-    resp = client.chat.completions.create(
+def _answer_cache_slot(question: str, chunks: List[Chunk], model: str, temperature: float) -> Optional[_CacheSlot]:
+    if not get_answer_cache().enabled:
+        return None
+    scope, version = index_version()
+    key = answer_cache_key(
+        question=question,
+        chunk_ids=[c.id for c in chunks],
         model=model,
-        messages=[
-            {"role": "system", "content": RAG_SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
         temperature=temperature,
+        prompt_hash=_PROMPT_HASH,
+        version=version,
     )
+    return key, scope, version
 
-    text = resp.choices[0].message.content or ""
 
-    # 3) Metrics
+def _cache_get(slot: Optional[_CacheSlot]) -> Optional[str]:
+    if slot is None:
+        return None
+    key, scope, version = slot
+    return get_answer_cache().get(key, scope=scope, version=version)
+
+
+def _cache_put(slot: Optional[_CacheSlot], text: str) -> None:
+    if slot is None or not text:
+        return
+    key, scope, version = slot
+    get_answer_cache().put(key, text, scope=scope, version=version)
+
+
+def _build_messages(question: str, packed: PackedContext) -> List[Dict[str, Any]]:
+    user_prompt = RAG_USER_PROMPT_TEMPLATE.format(context=packed.text, question=question)
+    return [
+        {"role": "system", "content": RAG_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _log_answer_metric(
+    *,
+    request_id: str,
+    question: str,
+    top_k: int,
+    chunks: List[Chunk],
+    packed: PackedContext,
+    text: str,
+    t0: float,
+    model: str,
+    short_circuit: bool = False,
+    cache_hit: bool = False,
+    coalesced: bool = False,
+    ttft_ms: Optional[int] = None,
+    stages: Optional[Dict[str, Any]] = None,
+) -> None:
     latency_ms = int((time.perf_counter() - t0) * 1000.0)
 
     refusal = text.strip() == REFUSAL_EXACT
     cited = _has_citations(text)
 
-    distances = []
-    for c in chunks:
-        # Chunk is yours; assume it has .distance (as shown in your earlier prints)
-        d = getattr(c, "distance", None)
-        if isinstance(d, (int, float)):
-            distances.append(float(d))
+    distances = _distances(chunks)
 
     _METRICS.log(
         make_metric(
@@ -95,17 +163,379 @@ def answer_question(
             question=question,
             top_k=top_k,
             distances=distances,
+            chosen_k=len(chunks),
+            num_chunks=len(chunks),
             cited=cited,
             refusal=refusal,
             latency_ms=latency_ms,
+            ttft_ms=ttft_ms,
+            **(stages or {}),
             source="rag",
             model=model,
             collection="rag-docs",
+            short_circuit=short_circuit,
+            cache_hit=cache_hit,
+            coalesced=coalesced,
             extra={
                 "num_chars_answer": len(text),
-                "num_tokens_est": None,  # keep None unless you add token counting later
+                "query_cache": query_cache_stats(),
+                "answer_cache": answer_cache_stats(),
+                "openai": openai_client_stats(),
+                "context_tokens_est": packed.tokens,
+                "context_blocks": len(packed.blocks),
+                # exact-reference fast path hits: no distance, so not part of the distance stats
+                "exact_reference_chunks": len(chunks) - len(distances),
             },
         )
     )
 
-    return RAGAnswer(question=question, answer=text, chunks=chunks)
+
+class AnswerStream:
+    """
+    Answer text as the model produces it: iterate to get the deltas (e.g. st.write_stream).
+
+    `refusal` and `cited` are updated while streaming: refusal stays None as long as the
+    text so far could still turn into REFUSAL_EXACT, and becomes False as soon as it can't.
+    Once the stream is exhausted, `result` holds the RAGAnswer and the metric is logged.
+    """
+
+    def __init__(
+        self,
+        *,
+        question: str,
+        chunks: List[Chunk],
+        packed: PackedContext,
+        deltas: Iterator[str],
+        t0: float,
+        on_done: Callable[["AnswerStream"], None],
+    ) -> None:
+        self.question = question
+        self.chunks = chunks
+        self.packed = packed
+        self.text = ""
+        self.refusal: Optional[bool] = None
+        self.cited = False
+        self.ttft_ms: Optional[int] = None
+        self.result: Optional[RAGAnswer] = None
+        self._deltas = deltas
+        self._t0 = t0
+        self._on_done = on_done
+
+    def _feed(self, delta: str) -> None:
+        tail = self.text[-8:]  # a citation marker can be split across two deltas
+        self.text += delta
+        if not self.cited:
+            self.cited = _has_citations(tail + delta)
+        if self.refusal is not False:
+            so_far = self.text.strip()
+            if so_far == REFUSAL_EXACT:
+                self.refusal = True
+            elif REFUSAL_EXACT.startswith(so_far):
+                self.refusal = None
+            else:
+                self.refusal = False
+
+    def __iter__(self) -> Iterator[str]:
+        if self.result is not None:
+            raise RuntimeError("AnswerStream can only be consumed once.")
+        for delta in self._deltas:
+            if not delta:
+                continue
+            if self.ttft_ms is None:
+                self.ttft_ms = int((time.perf_counter() - self._t0) * 1000.0)
+            self._feed(delta)
+            yield delta
+        self.refusal = self.text.strip() == REFUSAL_EXACT
+        self.result = RAGAnswer(
+            question=self.question,
+            answer=self.text,
+            chunks=self.chunks,
+            citations=self.packed.citation_map(),
+        )
+        self._on_done(self)
+
+
+def _since_ms(t: float) -> float:
+    return (time.perf_counter() - t) * 1000.0
+
+
+def _record_usage(stages: Dict[str, Any], usage: Any) -> None:
+    if usage is None:
+        return
+    stages["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    stages["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+
+def _stream_completion(
+    messages: List[Dict[str, Any]], model: str, temperature: float, stages: Dict[str, Any]
+) -> Iterator[str]:
+    t = time.perf_counter()
+    resp = chat_completion(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},  # usage comes in a last event without choices
+    )
+    for event in resp:
+        if event.choices:
+            delta = event.choices[0].delta.content or ""
+            if delta and "llm_ttft_ms" not in stages:
+                stages["llm_ttft_ms"] = _since_ms(t)
+            yield delta
+        _record_usage(stages, getattr(event, "usage", None))
+    stages["llm_ms"] = _since_ms(t)
+
+
+def _flight_key(
+    question: str, top_k: int, model: str, temperature: float, filters: Optional[RetrievalFilter]
+) -> str:
+    return flight_key(normalize_question(question), top_k, model, float(temperature), filters)
+
+
+def _log_coalesced_metric(question: str, result: RAGAnswer, *, top_k: int, model: str, t0: float) -> None:
+    # The leader already logged the stages/tokens; this records the waiting request itself.
+    _log_answer_metric(
+        request_id=str(uuid.uuid4())[:8],
+        question=question,
+        top_k=top_k,
+        chunks=result.chunks,
+        packed=pack_context(result.chunks),
+        text=result.answer,
+        t0=t0,
+        model=model,
+        coalesced=True,
+    )
+
+
+def answer_question(
+    question: str,
+    *,
+    top_k: int = 4,
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    chunks: Optional[List[Chunk]] = None,
+    filters: Optional[RetrievalFilter] = None,
+    stream: bool = False,
+) -> Union[RAGAnswer, AnswerStream]:
+    """
+    End-to-end: retrieve context -> ask LLM -> return answer with citations.
+    Also logs request-level metrics (per-stage latency, token usage/cost, retrieval
+    distances, refusal/citations).
+
+    Pass `chunks` (e.g. from `retrieve_many`) to skip the retrieval step,
+    or `filters` to search only part of the collection (e.g. one source document).
+    Answers are cached per (question, retrieved chunk ids, model, temperature, prompts)
+    until the index changes, see rag/answer_cache.py.
+
+    With stream=True, retrieval runs right away and an AnswerStream is returned;
+    the LLM call starts when it is iterated (time-to-first-token goes into the metric).
+
+    Concurrent calls for the same question/params wait for the one already in flight
+    and share its answer (coalesced=True); not for streams or caller-provided chunks.
+    """
+    if stream or chunks is not None or not SINGLE_FLIGHT_ENABLED:
+        return _answer_question(
+            question, top_k=top_k, model=model, temperature=temperature, chunks=chunks, filters=filters, stream=stream
+        )
+    t0 = time.perf_counter()
+    result, shared = _FLIGHTS.do(
+        _flight_key(question, top_k, model, temperature, filters),
+        lambda: _answer_question(question, top_k=top_k, model=model, temperature=temperature, filters=filters),
+    )
+    if not shared:
+        return result
+    _log_coalesced_metric(question, result, top_k=top_k, model=model, t0=t0)
+    return replace(result, question=question, coalesced=True)
+
+
+def _answer_question(
+    question: str,
+    *,
+    top_k: int = 4,
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    chunks: Optional[List[Chunk]] = None,
+    filters: Optional[RetrievalFilter] = None,
+    stream: bool = False,
+) -> Union[RAGAnswer, AnswerStream]:
+    request_id = str(uuid.uuid4())[:8]
+    t0 = time.perf_counter()
+    stages: Dict[str, Any] = {}  # per-stage timings + token usage, see InferenceMetric
+
+    # 1) Retrieve
+    if chunks is None:
+        chunks = retrieve(question, top_k=top_k, filters=filters, timings=stages)
+    t = time.perf_counter()
+    packed = pack_context(chunks)
+    messages = _build_messages(question, packed)
+    stages["format_ms"] = _since_ms(t)
+
+    # 2) Generate (skipped when retrieval is clearly off-topic or the answer is cached)
+    short_circuit = _should_short_circuit(chunks)
+    slot = None if short_circuit else _answer_cache_slot(question, chunks, model, temperature)
+    cached = _cache_get(slot)
+    if stream:
+        def on_done(s: AnswerStream) -> None:
+            if cached is None:
+                _cache_put(slot, s.text)
+            _log_answer_metric(
+                request_id=request_id,
+                question=question,
+                top_k=top_k,
+                chunks=chunks,
+                packed=packed,
+                text=s.text,
+                t0=t0,
+                model=model,
+                short_circuit=short_circuit,
+                cache_hit=cached is not None,
+                ttft_ms=s.ttft_ms,
+                stages=stages,
+            )
+
+        if short_circuit:
+            deltas = iter([REFUSAL_EXACT])
+        elif cached is not None:
+            deltas = iter([cached])
+        else:
+            deltas = _stream_completion(messages, model, temperature, stages)
+        return AnswerStream(question=question, chunks=chunks, packed=packed, deltas=deltas, t0=t0, on_done=on_done)
+
+    if short_circuit:
+        text = REFUSAL_EXACT
+    elif cached is not None:
+        text = cached
+    else:
+        t = time.perf_counter()
+        resp = chat_completion(model=model, messages=messages, temperature=temperature)
+        stages["llm_ms"] = _since_ms(t)
+        _record_usage(stages, getattr(resp, "usage", None))
+        text = resp.choices[0].message.content or ""
+        _cache_put(slot, text)
+
+    # 3) Metrics
+    _log_answer_metric(
+        request_id=request_id,
+        question=question,
+        top_k=top_k,
+        chunks=chunks,
+        packed=packed,
+        text=text,
+        t0=t0,
+        model=model,
+        short_circuit=short_circuit,
+        cache_hit=cached is not None,
+        stages=stages,
+    )
+
+    return RAGAnswer(question=question, answer=text, chunks=chunks, citations=packed.citation_map())
+
+
+async def answer_question_async(
+    question: str,
+    *,
+    top_k: int = 4,
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    chunks: Optional[List[Chunk]] = None,
+    filters: Optional[RetrievalFilter] = None,
+) -> RAGAnswer:
+    """
+    Async answer_question(): same steps and metrics, but the OpenAI calls are awaited
+    (AsyncOpenAI) and the vector store query runs in a worker thread.
+    Identical concurrent calls on the same event loop are coalesced as well.
+    """
+    if chunks is not None or not SINGLE_FLIGHT_ENABLED:
+        return await _answer_question_async(
+            question, top_k=top_k, model=model, temperature=temperature, chunks=chunks, filters=filters
+        )
+    t0 = time.perf_counter()
+    result, shared = await _ASYNC_FLIGHTS.do(
+        _flight_key(question, top_k, model, temperature, filters),
+        lambda: _answer_question_async(question, top_k=top_k, model=model, temperature=temperature, filters=filters),
+    )
+    if not shared:
+        return result
+    _log_coalesced_metric(question, result, top_k=top_k, model=model, t0=t0)
+    return replace(result, question=question, coalesced=True)
+
+
+async def _answer_question_async(
+    question: str,
+    *,
+    top_k: int = 4,
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    chunks: Optional[List[Chunk]] = None,
+    filters: Optional[RetrievalFilter] = None,
+) -> RAGAnswer:
+    request_id = str(uuid.uuid4())[:8]
+    t0 = time.perf_counter()
+    stages: Dict[str, Any] = {}
+
+    if chunks is None:
+        chunks = await retrieve_async(question, top_k=top_k, filters=filters, timings=stages)
+    t = time.perf_counter()
+    packed = pack_context(chunks)
+    messages = _build_messages(question, packed)
+    stages["format_ms"] = _since_ms(t)
+
+    short_circuit = _should_short_circuit(chunks)
+    slot = None if short_circuit else _answer_cache_slot(question, chunks, model, temperature)
+    # The disk tier is SQLite: keep it off the event loop.
+    cached = await asyncio.to_thread(_cache_get, slot) if get_answer_cache().path else _cache_get(slot)
+    if short_circuit:
+        text = REFUSAL_EXACT
+    elif cached is not None:
+        text = cached
+    else:
+        t = time.perf_counter()
+        resp = await chat_completion_async(model=model, messages=messages, temperature=temperature)
+        stages["llm_ms"] = _since_ms(t)
+        _record_usage(stages, getattr(resp, "usage", None))
+        text = resp.choices[0].message.content or ""
+        if get_answer_cache().path:
+            await asyncio.to_thread(_cache_put, slot, text)
+        else:
+            _cache_put(slot, text)
+
+    _log_answer_metric(
+        request_id=request_id,
+        question=question,
+        top_k=top_k,
+        chunks=chunks,
+        packed=packed,
+        text=text,
+        t0=t0,
+        model=model,
+        short_circuit=short_circuit,
+        cache_hit=cached is not None,
+        stages=stages,
+    )
+
+    return RAGAnswer(question=question, answer=text, chunks=chunks, citations=packed.citation_map())
+
+
+async def answer_many_async(
+    questions: List[str],
+    *,
+    max_concurrency: int = 16,
+    top_k: int = 4,
+    model: str = "gpt-4.1-mini",
+    temperature: float = 0.2,
+    filters: Optional[RetrievalFilter] = None,
+) -> List[RAGAnswer]:
+    """
+    Answers many questions from one event loop, with at most `max_concurrency`
+    requests in flight. Results come back in input order; the first error is raised.
+    """
+    sem = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def one(q: str) -> RAGAnswer:
+        async with sem:
+            return await answer_question_async(
+                q, top_k=top_k, model=model, temperature=temperature, filters=filters
+            )
+
+    return await asyncio.gather(*(one(q) for q in questions))
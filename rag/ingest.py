@@ -2,20 +2,203 @@
 from __future__ import annotations
 
 import argparse
-import tempfile
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Iterable, Optional, Union
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 from pypdf import PdfReader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from rag.store import VectorStoreConfig, get_collection, reset_collection
+from rag import parse_cache
+from rag.chunking import SEPARATORS, RecursiveChunker, TextChunk, chunk_pages, estimate_tokens
+from rag.embedding_cache import cache_stats, text_sha256
+from rag.lexical import LEXICAL_ENABLED, build_lexical_index, get_lexical_index
+from rag.manifest import IngestManifest, file_sha256
+from rag.store import (
+    VectorStoreConfig,
+    get_collection,
+    get_embedding_function,
+    physical_config,
+    rebuilding,
+)
+
+
+# PDFs with fewer pages are parsed in-process (pool start-up would dominate).
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+# Embedding batches are sized by (estimated) tokens, not by number of chunks.
+BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", "20000"))
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+_MAX_BATCH_INPUTS = 2048  # OpenAI embeddings API limit per request
+
+# One lock per physical collection: the manifest is loaded at the start of an ingest and
+# written back whole at the end, so two concurrent ingests would drop each other's entries.
+_COLLECTION_LOCKS: Dict[Tuple[str, str], threading.Lock] = {}
+_COLLECTION_LOCKS_GUARD = threading.Lock()
+
+
+def _collection_lock(config: VectorStoreConfig) -> threading.Lock:
+    key = (config.persist_path, config.collection_name)
+    with _COLLECTION_LOCKS_GUARD:
+        return _COLLECTION_LOCKS.setdefault(key, threading.Lock())
+
+
+@dataclass
+class IngestStats:
+    """
+    Throughput counters filled by the ingest functions (pass one in via `stats=`).
+    """
+    chunks: int = 0
+    tokens: int = 0
+    batches: int = 0
+    embed_s: float = 0.0
+    wall_s: float = 0.0
+
+    def summary(self) -> str:
+        wall = self.wall_s or 1e-9
+        return (
+            f"{self.chunks} chunks / ~{self.tokens} tokens embedded in {self.batches} batches, "
+            f"{self.wall_s:.1f}s wall: {self.chunks / wall:.1f} chunks/s, {self.tokens / wall:.0f} tokens/s"
+        )
+
+
+class _BatchWriter:
+    """
+    Groups chunks into token-sized batches, embeds up to `concurrency` batches in
+    parallel while the caller keeps producing chunks, and upserts finished batches
+    in order with pre-computed `embeddings=`.
+    """
+
+    def __init__(self, collection, ef, *, batch_tokens: int, concurrency: int, stats: Optional[IngestStats]) -> None:
+        self._collection = collection
+        self._ef = ef
+        self._batch_tokens = batch_tokens
+        self._concurrency = max(1, concurrency)
+        self._stats = stats
+        self._pool = ThreadPoolExecutor(max_workers=self._concurrency)
+        self._inflight: deque = deque()
+        self._ids: List[str] = []
+        self._docs: List[str] = []
+        self._metas: List[Dict[str, Any]] = []
+        self._tokens = 0
+
+    def __enter__(self) -> "_BatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self._flush()
+                while self._inflight:
+                    self._write_oldest()
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=exc_type is not None)
+
+    def add(self, _id: str, doc: str, meta: Dict[str, Any]) -> None:
+        tokens = estimate_tokens(doc)
+        if self._ids and (self._tokens + tokens > self._batch_tokens or len(self._ids) >= _MAX_BATCH_INPUTS):
+            self._flush()
+        self._ids.append(_id)
+        self._docs.append(doc)
+        self._metas.append(meta)
+        self._tokens += tokens
+
+    def _embed(self, docs: List[str]):
+        t0 = time.perf_counter()
+        vectors = self._ef(docs)
+        return vectors, time.perf_counter() - t0
+
+    def _flush(self) -> None:
+        if not self._ids:
+            return
+        fut = self._pool.submit(self._embed, self._docs)
+        self._inflight.append((fut, self._ids, self._docs, self._metas, self._tokens))
+        self._ids, self._docs, self._metas, self._tokens = [], [], [], 0
+
+        # Bounded pipeline: block on the oldest batch once too many are in flight.
+        while len(self._inflight) > self._concurrency:
+            self._write_oldest()
+
+    def _write_oldest(self) -> None:
+        fut, ids, docs, metas, tokens = self._inflight.popleft()
+        vectors, embed_s = fut.result()
+        self._collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=vectors)
+        if self._stats is not None:
+            self._stats.chunks += len(ids)
+            self._stats.tokens += tokens
+            self._stats.batches += 1
+            self._stats.embed_s += embed_s
+
+
+def _default_workers() -> int:
+    return int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process: each worker opens its own reader.
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_numbered_pages(
+    pdf: Union[Path, BinaryIO],
+    *,
+    max_workers: Optional[int] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (1-based page number, text) for each non-empty page, in page order,
+    extracting every page once.
+
+    `pdf` is a path or an in-memory binary stream (e.g. BytesIO / Streamlit upload).
+    Large PDFs on disk are split into page ranges parsed by a process pool; streams
+    are parsed in-process so the upload is never copied into worker processes.
+    """
+    on_disk = isinstance(pdf, (str, Path))
+    if not on_disk:
+        pdf.seek(0)
+    reader = PdfReader(str(pdf) if on_disk else pdf)
+    n_pages = len(reader.pages)
+    workers = min(max_workers or _default_workers(), n_pages) if on_disk else 1
+
+    if workers <= 1 or n_pages < PARALLEL_MIN_PAGES:
+        for i, page in enumerate(reader.pages, start=1):
+            text = page.extract_text()
+            if text:
+                yield i, text
+        return
+
+    # Several ranges per worker keeps the pool busy when some pages are heavier.
+    step = max(1, -(-n_pages // (workers * 4)))
+    ranges = [(a, min(a + step, n_pages)) for a in range(0, n_pages, step)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_extract_page_range, str(pdf), a, b) for a, b in ranges]
+        for (a, _), fut in zip(ranges, futures):  # in submission order => page order
+            for i, text in enumerate(fut.result(), start=a + 1):
+                if text:
+                    yield i, text
+
+
+def iter_pdf_pages(pdf: Union[Path, BinaryIO], *, max_workers: Optional[int] = None) -> Iterator[str]:
+    for _, text in iter_numbered_pages(pdf, max_workers=max_workers):
+        yield text
 
 
 def extract_text_from_pdf_path(pdf_path: Path) -> str:
-    reader = PdfReader(str(pdf_path))
-    pages = [p.extract_text() for p in reader.pages if p.extract_text()]
-    return "\n".join(pages)
+    return "\n".join(iter_pdf_pages(pdf_path))
+
+
+def _as_stream(pdf_bytes: Union[bytes, bytearray, BinaryIO]) -> BinaryIO:
+    # BytesIO over an immutable bytes object shares its buffer until something writes
+    # to it or calls getbuffer() (a bytearray is always copied).
+    if isinstance(pdf_bytes, (bytes, bytearray)):
+        return io.BytesIO(pdf_bytes)
+    return pdf_bytes
 
 
 def chunk_text(
@@ -24,12 +207,220 @@ def chunk_text(
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
 ) -> list[str]:
-    splitter = RecursiveCharacterTextSplitter(
+    chunker = RecursiveChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=SEPARATORS)
+    return [c.text for c in chunker.split(text)]
+
+
+_CHUNKER = "native-recursive-v1"
+
+
+def iter_chunks_cached(
+    pdf: Union[Path, BinaryIO],
+    pdf_sha256: str,
+    *,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    max_workers: Optional[int] = None,
+) -> Iterator[TextChunk]:
+    """
+    chunk_pages(iter_numbered_pages(pdf)) backed by the on-disk parse cache:
+    pages are cached by PDF sha256, chunk lists by (text hash, chunking params).
+    A full hit neither parses nor chunks; a miss streams as usual and fills the cache.
+    """
+    def key(pages: List[Tuple[int, str]]) -> str:
+        return parse_cache.chunks_key(
+            parse_cache.pages_sha256(text for _, text in pages),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=SEPARATORS,
+            chunker=_CHUNKER,
+        )
+
+    pages = parse_cache.load_pages(pdf_sha256)
+    if pages is not None:
+        chunks_key = key(pages)
+        cached = parse_cache.load_chunks(chunks_key)
+        if cached is not None:
+            for c in cached:
+                yield TextChunk(**c)
+            return
+        page_iter: Iterable[Tuple[int, str]] = pages
+    else:
+        pages = []
+
+        def page_iter_fn() -> Iterator[Tuple[int, str]]:
+            for page in iter_numbered_pages(pdf, max_workers=max_workers):
+                pages.append(page)
+                yield page
+
+        page_iter = page_iter_fn()
+        chunks_key = None
+
+    produced: List[TextChunk] = []
+    for chunk in chunk_pages(page_iter, chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+        produced.append(chunk)
+        yield chunk
+
+    if chunks_key is None:
+        parse_cache.save_pages(pdf_sha256, pages)
+        chunks_key = key(pages)
+    parse_cache.save_chunks(chunks_key, [asdict(c) for c in produced])
+
+
+def _prepare_chunks(
+    pdf_path: Path,
+    pdf_sha256: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    max_workers: Optional[int] = None,
+) -> List[TextChunk]:
+    return list(
+        iter_chunks_cached(
+            pdf_path,
+            pdf_sha256,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            max_workers=max_workers,
+        )
+    )
+
+
+def _chunk_params(chunk_size: int, chunk_overlap: int) -> dict:
+    return {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+
+
+def _chunk_metadata(source: str, index: int, chunk: TextChunk) -> Dict[str, Any]:
+    meta: Dict[str, Any] = {
+        "source": source,
+        "chunk_index": index,
+        "start_char": chunk.start,
+        "end_char": chunk.end,
+    }
+    # Chroma metadata values can't be None
+    if chunk.page_start is not None:
+        meta["page_start"] = chunk.page_start
+        meta["page_end"] = chunk.page_end
+    return meta
+
+
+def _sync_chunks(
+    config: VectorStoreConfig,
+    manifest: IngestManifest,
+    source: str,
+    chunks: Iterable[TextChunk],
+    *,
+    params: dict,
+    file_info: dict,
+    batch_tokens: int = BATCH_TOKENS,
+    embed_concurrency: int = EMBED_CONCURRENCY,
+    stats: Optional[IngestStats] = None,
+) -> int:
+    """
+    Makes the collection hold exactly `chunks` for `source`:
+    upserts only chunks whose text changed and deletes ids past the new end.
+    `chunks` may be a generator: embedding/writing overlaps with its production.
+    Returns the number of chunks the source now has in the index.
+    """
+    collection = get_collection(config, create_if_missing=True)
+    old = manifest.get(source) or {}
+    old_ids = old.get("ids", [])
+    old_hashes = old.get("chunk_sha256", [])
+
+    ids: List[str] = []
+    hashes: List[str] = []
+    with _BatchWriter(
+        collection,
+        get_embedding_function(config),
+        batch_tokens=batch_tokens,
+        concurrency=embed_concurrency,
+        stats=stats,
+    ) as writer:
+        for i, chunk in enumerate(chunks):
+            _id = f"{source}-{i}"
+            meta = _chunk_metadata(source, i, chunk)
+            # offsets/pages are part of the fingerprint: same text can move
+            h = text_sha256(f"{chunk.text}\0{chunk.start}:{chunk.end}:{chunk.page_start}:{chunk.page_end}")
+            ids.append(_id)
+            hashes.append(h)
+            if i >= len(old_hashes) or old_hashes[i] != h or old_ids[i] != _id:
+                writer.add(_id, chunk.text, meta)
+
+    keep = set(ids)
+    stale = [i for i in old_ids if i not in keep]
+    if stale:
+        collection.delete(ids=stale)
+
+    manifest.set(source, {**file_info, "params": params, "ids": ids, "chunk_sha256": hashes})
+    manifest.save()
+    return len(ids)
+
+
+def _file_info(pdf_path: Path) -> dict:
+    st = pdf_path.stat()
+    return {"sha256": file_sha256(pdf_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _bytes_info(data: Union[bytes, bytearray]) -> dict:
+    return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "mtime_ns": None}
+
+
+def _stream_info(stream: BinaryIO) -> dict:
+    # Read in blocks: BytesIO.getbuffer() would un-share the buffer, i.e. copy the whole upload.
+    h = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1 << 20), b""):
+        h.update(block)
+        size += len(block)
+    stream.seek(0)
+    return {"sha256": h.hexdigest(), "size": size, "mtime_ns": None}
+
+
+def _ingest_source(
+    config: VectorStoreConfig,
+    manifest: IngestManifest,
+    source: str,
+    pdf: Union[Path, BinaryIO],
+    *,
+    file_info: dict,
+    chunk_size: int,
+    chunk_overlap: int,
+    max_workers: Optional[int],
+    batch_tokens: int,
+    embed_concurrency: int,
+    stats: Optional[IngestStats],
+) -> int:
+    t0 = time.perf_counter()
+    chunks = iter_chunks_cached(
+        pdf,
+        file_info["sha256"],
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", "Article ", ".", " ", ""],
+        max_workers=max_workers,
     )
-    return splitter.split_text(text)
+    n = _sync_chunks(
+        config,
+        manifest,
+        source,
+        chunks,
+        params=_chunk_params(chunk_size, chunk_overlap),
+        file_info=file_info,
+        batch_tokens=batch_tokens,
+        embed_concurrency=embed_concurrency,
+        stats=stats,
+    )
+    if stats is not None:
+        stats.wall_s += time.perf_counter() - t0
+    return n
+
+
+def _refresh_lexical_index(config: VectorStoreConfig, *, changed: bool) -> None:
+    # The BM25/reference index covers the whole collection; rebuilding it after writes
+    # is cheap next to embedding, and keeps deletions and re-chunking trivially correct.
+    if not LEXICAL_ENABLED:
+        return
+    if changed or get_lexical_index(config.persist_path, config.collection_name) is None:
+        build_lexical_index(get_collection(config), config.persist_path, config.collection_name)
 
 
 def ingest_pdf_path(
@@ -39,57 +430,172 @@ def ingest_pdf_path(
     reset: bool = False,
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
+    max_workers: Optional[int] = None,
+    batch_tokens: int = BATCH_TOKENS,
+    embed_concurrency: int = EMBED_CONCURRENCY,
+    stats: Optional[IngestStats] = None,
 ) -> int:
     """
     Ingest a single PDF from disk into the vector store.
-    Returns number of chunks added.
+    Returns number of chunks indexed for this PDF.
+
+    Idempotent: an unchanged PDF (per the collection's manifest) is skipped
+    without parsing; a changed one only upserts/deletes the chunks that differ.
+    Parsing, chunking, embedding and writing are pipelined.
     """
     if not pdf_path.exists():
         raise FileNotFoundError(pdf_path)
 
-    collection = reset_collection(config) if reset else get_collection(config, create_if_missing=True)
+    if reset:
+        # In versioned mode readers keep the old index until this build completes.
+        with rebuilding(config) as target:
+            return ingest_pdf_path(
+                pdf_path,
+                config=target,
+                reset=False,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                max_workers=max_workers,
+                batch_tokens=batch_tokens,
+                embed_concurrency=embed_concurrency,
+                stats=stats,
+            )
 
-    text = extract_text_from_pdf_path(pdf_path)
-    chunks = chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    config = physical_config(config)
+    with _collection_lock(config):
+        return _ingest_path_locked(
+            pdf_path,
+            config,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            max_workers=max_workers,
+            batch_tokens=batch_tokens,
+            embed_concurrency=embed_concurrency,
+            stats=stats,
+        )
 
-    if not chunks:
-        return 0
 
-    ids = [f"{pdf_path.name}-{i}" for i in range(len(chunks))]
-    metadatas = [{"source": pdf_path.name, "chunk_index": i} for i in range(len(chunks))]
+def _ingest_path_locked(
+    pdf_path: Path,
+    config: VectorStoreConfig,
+    *,
+    chunk_size: int,
+    chunk_overlap: int,
+    max_workers: Optional[int],
+    batch_tokens: int,
+    embed_concurrency: int,
+    stats: Optional[IngestStats],
+) -> int:
+    manifest = IngestManifest.for_collection(config.persist_path, config.collection_name)
+    if manifest.is_unchanged(pdf_path.name, pdf_path, _chunk_params(chunk_size, chunk_overlap)):
+        _refresh_lexical_index(config, changed=False)
+        return len(manifest.get(pdf_path.name)["ids"])
 
-    collection.add(documents=chunks, ids=ids, metadatas=metadatas)
-    return len(chunks)
+    n = _ingest_source(
+        config,
+        manifest,
+        pdf_path.name,
+        pdf_path,
+        file_info=_file_info(pdf_path),
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        max_workers=max_workers,
+        batch_tokens=batch_tokens,
+        embed_concurrency=embed_concurrency,
+        stats=stats,
+    )
+    _refresh_lexical_index(config, changed=True)
+    return n
 
 #Without this function the RAG cannot see the uploaded PDFs in Streamlit because they are provided as bytes and wants pdfs or director with pdfs. 
 def ingest_pdf_bytes(
-    pdf_bytes: bytes,
+    pdf_bytes: Union[bytes, BinaryIO],
     *,
     filename: str = "uploaded.pdf",
     config: VectorStoreConfig = VectorStoreConfig(),
     reset: bool = False,
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
+    batch_tokens: int = BATCH_TOKENS,
+    embed_concurrency: int = EMBED_CONCURRENCY,
+    stats: Optional[IngestStats] = None,
 ) -> int:
     """
-    Ingest a PDF provided as bytes (Streamlit uploader).
-    We write to a temp file because PdfReader expects a file path reliably.
+    Ingest a PDF provided in memory (Streamlit uploader): bytes or a binary stream
+    such as BytesIO / the UploadedFile itself. Parsed straight from memory, no temp file.
+    Same manifest/skip behaviour as ingest_pdf_path, with `filename` as the source name.
     """
-    if not pdf_bytes:
+    if isinstance(pdf_bytes, (bytes, bytearray)):
+        info = _bytes_info(pdf_bytes)  # hash the caller's buffer before wrapping it
+    else:
+        info = _stream_info(pdf_bytes)
+    stream = _as_stream(pdf_bytes)
+    if info["size"] == 0:
         return 0
 
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as tmp:
-        tmp.write(pdf_bytes)
-        tmp.flush()
-        return ingest_pdf_path(
-            Path(tmp.name),
-            config=config,
-            reset=reset,
+    if reset:
+        with rebuilding(config) as target:
+            return ingest_pdf_bytes(
+                pdf_bytes,
+                filename=filename,
+                config=target,
+                reset=False,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                batch_tokens=batch_tokens,
+                embed_concurrency=embed_concurrency,
+                stats=stats,
+            )
+
+    config = physical_config(config)
+    with _collection_lock(config):
+        return _ingest_stream_locked(
+            stream,
+            info,
+            filename,
+            config,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
+            batch_tokens=batch_tokens,
+            embed_concurrency=embed_concurrency,
+            stats=stats,
         )
 
 
+def _ingest_stream_locked(
+    stream: BinaryIO,
+    info: dict,
+    filename: str,
+    config: VectorStoreConfig,
+    *,
+    chunk_size: int,
+    chunk_overlap: int,
+    batch_tokens: int,
+    embed_concurrency: int,
+    stats: Optional[IngestStats],
+) -> int:
+    manifest = IngestManifest.for_collection(config.persist_path, config.collection_name)
+    if manifest.matches(filename, info["sha256"], _chunk_params(chunk_size, chunk_overlap)):
+        _refresh_lexical_index(config, changed=False)
+        return len(manifest.get(filename)["ids"])
+
+    n = _ingest_source(
+        config,
+        manifest,
+        filename,
+        stream,
+        file_info=info,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        max_workers=1,
+        batch_tokens=batch_tokens,
+        embed_concurrency=embed_concurrency,
+        stats=stats,
+    )
+    _refresh_lexical_index(config, changed=True)
+    return n
+
+
 def ingest_pdf_dir(
     pdf_dir: Path,
     *,
@@ -97,27 +603,133 @@ def ingest_pdf_dir(
     reset: bool = False,
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
+    max_workers: Optional[int] = None,
+    batch_tokens: int = BATCH_TOKENS,
+    embed_concurrency: int = EMBED_CONCURRENCY,
+    stats: Optional[IngestStats] = None,
 ) -> int:
     """
-    Ingest all PDFs in a directory. Returns total chunks added.
-    If reset=True, it resets once at the start.
+    Ingest all PDFs in a directory. Returns total chunks indexed.
+    Unchanged PDFs are skipped (see ingest_pdf_path), so this is cheap to run on a schedule.
+    PDFs deleted from the directory since the last run have their chunks removed.
+    PDFs are parsed and chunked concurrently (one process per PDF); writes stay in order.
+    If reset=True, it resets once at the start (versioned mode: builds a new
+    version and publishes it when all PDFs are in).
     """
     if not pdf_dir.exists():
         raise FileNotFoundError(pdf_dir)
 
+    opts = dict(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        max_workers=max_workers,
+        batch_tokens=batch_tokens,
+        embed_concurrency=embed_concurrency,
+        stats=stats,
+    )
+
     if reset:
-        reset_collection(config)
+        with rebuilding(config) as target:
+            return ingest_pdf_dir(pdf_dir, config=target, reset=False, **opts)
+
+    config = physical_config(config)
+    with _collection_lock(config):
+        return _ingest_dir_locked(pdf_dir, config, **opts)
+
+
+def _remove_missing_sources(
+    config: VectorStoreConfig,
+    manifest: IngestManifest,
+    dir_key: str,
+    present: Set[str],
+) -> int:
+    """
+    Deletes the chunks of PDFs that an earlier ingest of this directory indexed but
+    that are no longer in it. Returns the number of sources removed.
+    """
+    gone = [s for s, e in manifest.sources.items() if e.get("dir") == dir_key and s not in present]
+    if not gone:
+        return 0
+    collection = get_collection(config, create_if_missing=True)
+    for source in gone:
+        ids = manifest.get(source).get("ids", [])
+        if ids:
+            collection.delete(ids=ids)
+        manifest.remove(source)
+    manifest.save()
+    return len(gone)
+
+
+def _ingest_dir_locked(
+    pdf_dir: Path,
+    config: VectorStoreConfig,
+    *,
+    chunk_size: int,
+    chunk_overlap: int,
+    max_workers: Optional[int],
+    batch_tokens: int,
+    embed_concurrency: int,
+    stats: Optional[IngestStats],
+) -> int:
+    opts = dict(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        max_workers=max_workers,
+        batch_tokens=batch_tokens,
+        embed_concurrency=embed_concurrency,
+        stats=stats,
+    )
+    manifest = IngestManifest.for_collection(config.persist_path, config.collection_name)
+    params = _chunk_params(chunk_size, chunk_overlap)
+
+    dir_key = str(pdf_dir.resolve())
+    present = sorted(pdf_dir.glob("*.pdf"))
+    removed = _remove_missing_sources(config, manifest, dir_key, {pdf.name for pdf in present})
 
     total = 0
-    for pdf in sorted(pdf_dir.glob("*.pdf")):
-        n = ingest_pdf_path(
-            pdf,
-            config=config,
-            reset=False,  # already reset above (if needed)
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-        )
-        total += n
+    pdfs = []
+    for pdf in present:
+        if manifest.is_unchanged(pdf.name, pdf, params):
+            total += len(manifest.get(pdf.name)["ids"])
+            if manifest.get(pdf.name).get("dir") != dir_key:
+                # ingested before sources were tagged with their directory
+                manifest.get(pdf.name)["dir"] = dir_key
+                manifest.save()
+        else:
+            pdfs.append(pdf)
+
+    workers = min(max_workers or _default_workers(), len(pdfs))
+
+    if workers <= 1:
+        # Single PDF (or single core): let _ingest_source parallelise over pages instead.
+        for pdf in pdfs:
+            info = {**_file_info(pdf), "dir": dir_key}
+            total += _ingest_source(config, manifest, pdf.name, pdf, file_info=info, **opts)
+        _refresh_lexical_index(config, changed=bool(pdfs) or removed > 0)
+        return total
+
+    t0 = time.perf_counter()
+    infos = [{**_file_info(pdf), "dir": dir_key} for pdf in pdfs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_prepare_chunks, pdf, info["sha256"], chunk_size, chunk_overlap, 1)
+            for pdf, info in zip(pdfs, infos)
+        ]
+        for pdf, info, fut in zip(pdfs, infos, futures):
+            total += _sync_chunks(
+                config,
+                manifest,
+                pdf.name,
+                fut.result(),
+                params=params,
+                file_info=info,
+                batch_tokens=batch_tokens,
+                embed_concurrency=embed_concurrency,
+                stats=stats,
+            )
+    if stats is not None:
+        stats.wall_s += time.perf_counter() - t0
+    _refresh_lexical_index(config, changed=True)
     return total
 
 
@@ -127,15 +739,26 @@ def main():
     parser.add_argument("--reset", action="store_true", help="Reset collection before ingest")
     parser.add_argument("--chunk-size", type=int, default=1000)
     parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-tokens", type=int, default=BATCH_TOKENS, help="Estimated tokens per embedding request")
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_CONCURRENCY, help="Embedding requests in flight")
     args = parser.parse_args()
 
+    stats = IngestStats()
     total = ingest_pdf_dir(
         Path(args.pdf_dir),
         reset=args.reset,
         chunk_size=args.chunk_size,
         chunk_overlap=args.chunk_overlap,
+        max_workers=args.workers,
+        batch_tokens=args.batch_tokens,
+        embed_concurrency=args.embed_concurrency,
+        stats=stats,
     )
     print(f"✅ Ingested total chunks: {total}")
+    print(f"Throughput: {stats.summary()}")
+    for path, cstats in cache_stats().items():
+        print(f"Embedding cache {path}: {cstats}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+# rag/jobs.py
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from rag.answer_cache import index_version
+from rag.ingest import IngestStats, ingest_pdf_bytes
+from rag.store import VectorStoreConfig
+
+
+@dataclass
+class IngestJob:
+    """
+    One background ingestion, identified by the sha256 of the uploaded bytes and the
+    ingest options. `index_version` is the index version the job left behind.
+    `stats.chunks` grows while the job runs and doubles as a progress counter.
+    """
+    job_id: str
+    filename: str
+    status: str = "queued"  # queued | running | done | failed
+    n_chunks: Optional[int] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    index_version: Optional[str] = None
+    stats: IngestStats = field(default_factory=IngestStats)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+def _content_sha256(pdf_bytes: Union[bytes, BinaryIO]) -> str:
+    if isinstance(pdf_bytes, (bytes, bytearray)):
+        return hashlib.sha256(pdf_bytes).hexdigest()
+    h = hashlib.sha256()
+    pdf_bytes.seek(0)
+    for block in iter(lambda: pdf_bytes.read(1 << 20), b""):
+        h.update(block)
+    pdf_bytes.seek(0)
+    return h.hexdigest()
+
+
+class IngestJobRunner:
+    """
+    Runs PDF ingestion off the request thread (Streamlit reruns stay responsive).
+
+    Jobs are de-duplicated by (content hash, reset, chunking params): submitting the same
+    upload again returns the queued/running job, or the finished one as long as the index
+    hasn't changed since it finished. After e.g. another upload reset the index, the same
+    bytes run again, so a wiped document is re-ingested. Failed jobs are retried too.
+
+    Ingests into one collection are serialized anyway (the manifest is read-modify-write,
+    see rag.ingest), so one worker keeps waiting jobs honestly "queued".
+    """
+
+    def __init__(self, *, max_workers: int = 1, config: VectorStoreConfig = VectorStoreConfig()) -> None:
+        self.config = config
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        pdf_bytes: Union[bytes, BinaryIO],
+        *,
+        filename: str,
+        reset: bool = False,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+    ) -> IngestJob:
+        """
+        `pdf_bytes` may be a binary stream (e.g. Streamlit's UploadedFile): it is hashed in
+        blocks and handed to the worker as is, so the upload is never copied.
+        """
+        key = [_content_sha256(pdf_bytes), reset, chunk_size, chunk_overlap]
+        job_id = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and (job.active or (job.status == "done" and self._current(job))):
+                return job
+
+            job = IngestJob(job_id=job_id, filename=filename)
+            self._jobs[job_id] = job
+
+        self._pool.submit(self._run, job, pdf_bytes, reset, chunk_size, chunk_overlap)
+        return job
+
+    def _run(self, job: IngestJob, pdf_bytes: Union[bytes, BinaryIO], reset: bool, chunk_size: int, chunk_overlap: int) -> None:
+        job.status = "running"
+        try:
+            job.n_chunks = ingest_pdf_bytes(
+                pdf_bytes,
+                filename=job.filename,
+                config=self.config,
+                reset=reset,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                stats=job.stats,
+            )
+            job.index_version = index_version(self.config)[1]
+            job.status = "done"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _current(self, job: IngestJob) -> bool:
+        # The index is still what this job left (nobody reset or re-ingested since).
+        return job.index_version == index_version(self.config)[1]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[IngestJob]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def has_active(self) -> bool:
+        with self._lock:
+            return any(j.active for j in self._jobs.values())
@@ -0,0 +1,340 @@
+# rag/lexical.py
+from __future__ import annotations
+
+import io
+import json
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.filters import RetrievalFilter
+
+# Persisted BM25 index next to the vector store: <persist>/lexical/<collection>.npz.
+# LEXICAL_INDEX=0 skips building it during ingestion.
+LEXICAL_ENABLED = os.getenv("LEXICAL_INDEX", "1") == "1"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with".split()
+)
+
+# Structural references in questions ("Article 17", "recital 39") ...
+_REF_QUERY_RE = re.compile(r"\b(article|recital)\s+(\d+)\b", re.IGNORECASE)
+# ... and where they start in the document text: "Article 17" alone on a line,
+# "(39)  Any processing..." in the preamble (but not footnotes like "(1) OJ L 119").
+_ARTICLE_HEADING_RE = re.compile(r"^Article\s+(\d+)\s*$", re.MULTILINE)
+_RECITAL_RE = re.compile(r"^\((\d+)\)\s+(?!OJ\b)", re.MULTILINE)
+
+_FORMAT = 2  # bump when the saved arrays change; older files are rebuilt on the next ingest
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS]
+
+
+def structural_refs(query: str) -> List[str]:
+    """
+    Normalized references named in `query`, in order: ["article 17", "recital 39"].
+    """
+    refs = [f"{kind.lower()} {int(num)}" for kind, num in _REF_QUERY_RE.findall(query or "")]
+    return list(dict.fromkeys(refs))
+
+
+def lexical_index_path(persist_path: str, collection_name: str) -> Path:
+    return Path(persist_path) / "lexical" / f"{collection_name}.npz"
+
+
+def delete_lexical_index(persist_path: str, collection_name: str) -> None:
+    lexical_index_path(persist_path, collection_name).unlink(missing_ok=True)
+
+
+def _reference_map(ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    "article 17" -> ids of the chunks covering that article, in document order.
+    A chunk belongs to the reference open at its start and to every heading inside it.
+    Recitals are only recognized before a source's first article heading.
+    """
+    by_source: Dict[Any, List[Tuple[int, int]]] = {}
+    for pos, meta in enumerate(metadatas):
+        idx = (meta or {}).get("chunk_index")
+        if isinstance(idx, int):
+            by_source.setdefault((meta or {}).get("source"), []).append((idx, pos))
+
+    refs: Dict[str, List[str]] = {}
+    for items in by_source.values():
+        current: Optional[str] = None
+        in_articles = False
+        for _, pos in sorted(items):
+            text = documents[pos] or ""
+            heads = [(m.start(), f"article {int(m.group(1))}") for m in _ARTICLE_HEADING_RE.finditer(text)]
+            if not in_articles:
+                first_article = heads[0][0] if heads else len(text)
+                heads += [
+                    (m.start(), f"recital {int(m.group(1))}")
+                    for m in _RECITAL_RE.finditer(text)
+                    if m.start() < first_article
+                ]
+                heads.sort()
+
+            keys = ([current] if current and (not heads or heads[0][0] > 0) else []) + [k for _, k in heads]
+            for key in keys:
+                lst = refs.setdefault(key, [])
+                if not lst or lst[-1] != ids[pos]:
+                    lst.append(ids[pos])
+
+            if heads:
+                current = heads[-1][1]
+            in_articles = in_articles or any(k.startswith("article ") for _, k in heads)
+    return refs
+
+
+class LexicalIndex:
+    """
+    BM25 over chunk texts with CSR postings: the documents containing term t are
+    postings[offsets[t]:offsets[t + 1]], with term frequencies in `tfs`.
+    Also keeps the article/recital -> chunk ids map used by the exact-reference fast path,
+    and each chunk's source/chunk_index so source and range filters apply without the store.
+    """
+
+    def __init__(
+        self,
+        *,
+        ids: List[str],
+        terms: List[str],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        sources: List[Any],
+        doc_source: np.ndarray,
+        doc_chunk: np.ndarray,
+        refs: Dict[str, List[str]],
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.ids = ids
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.sources = sources
+        self.doc_source = doc_source
+        self.doc_chunk = doc_chunk
+        self.refs = refs
+        self._pos = {cid: n for n, cid in enumerate(ids)}
+        self.k1 = k1
+        self.b = b
+
+        n = len(ids)
+        df = np.diff(offsets).astype(np.float32)
+        self._idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_len.mean()) if n else 1.0
+        self._norm = (k1 * (1.0 - b + b * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> "LexicalIndex":
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        freqs: List[int] = []
+        doc_len = np.zeros(len(ids), dtype=np.int32)
+        source_ids: Dict[Any, int] = {}
+        doc_source = np.zeros(len(ids), dtype=np.int32)
+        doc_chunk = np.full(len(ids), -1, dtype=np.int32)  # -1: no chunk_index
+
+        for d, meta in enumerate(metadatas):
+            meta = meta or {}
+            doc_source[d] = source_ids.setdefault(meta.get("source"), len(source_ids))
+            if isinstance(meta.get("chunk_index"), int):
+                doc_chunk[d] = meta["chunk_index"]
+
+        for d, text in enumerate(documents):
+            tokens = tokenize(text)
+            doc_len[d] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(d)
+                freqs.append(tf)
+
+        t = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(t, kind="stable")  # stable: postings stay sorted by doc id
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(t, minlength=len(vocab)), out=offsets[1:])
+
+        return cls(
+            ids=[str(i) for i in ids],
+            terms=list(vocab),
+            offsets=offsets,
+            postings=np.asarray(doc_ids, dtype=np.int32)[order],
+            tfs=np.minimum(np.asarray(freqs, dtype=np.int64)[order], np.iinfo(np.uint16).max).astype(np.uint16),
+            doc_len=doc_len,
+            sources=list(source_ids),
+            doc_source=doc_source,
+            doc_chunk=doc_chunk,
+            refs=_reference_map(ids, documents, metadatas),
+        )
+
+    def save(self, path: Path) -> None:
+        meta = {
+            "format": _FORMAT,
+            "ids": self.ids,
+            "terms": self.terms,
+            "sources": self.sources,
+            "refs": self.refs,
+            "k1": self.k1,
+            "b": self.b,
+        }
+        buf = io.BytesIO()
+        np.savez(
+            buf,
+            offsets=self.offsets,
+            postings=self.postings,
+            tfs=self.tfs,
+            doc_len=self.doc_len,
+            doc_source=self.doc_source,
+            doc_chunk=self.doc_chunk,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+        tmp.write_bytes(buf.getvalue())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["LexicalIndex"]:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format") != _FORMAT:
+                return None
+            return cls(
+                ids=meta["ids"],
+                terms=meta["terms"],
+                offsets=data["offsets"],
+                postings=data["postings"],
+                tfs=data["tfs"],
+                doc_len=data["doc_len"],
+                sources=meta["sources"],
+                doc_source=data["doc_source"],
+                doc_chunk=data["doc_chunk"],
+                refs=meta["refs"],
+                k1=meta["k1"],
+                b=meta["b"],
+            )
+
+    def mask(self, filters: Optional[RetrievalFilter]) -> Optional[np.ndarray]:
+        """
+        Boolean row mask for the source / chunk_index part of `filters` (None = all rows).
+        Raw `where` predicates are left to the store.
+        """
+        if filters is None:
+            return None
+        mask: Optional[np.ndarray] = None
+        sources = filters.sources()
+        if sources is not None:
+            wanted = [n for n, src in enumerate(self.sources) if src in sources]
+            mask = np.isin(self.doc_source, wanted)
+        if filters.chunk_index_min is not None:
+            m = self.doc_chunk >= filters.chunk_index_min
+            mask = m if mask is None else mask & m
+        if filters.chunk_index_max is not None:
+            m = (self.doc_chunk <= filters.chunk_index_max) & (self.doc_chunk >= 0)
+            mask = m if mask is None else mask & m
+        return mask
+
+    def search(self, query: str, top_n: int = 20, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        BM25 top `top_n` as (chunk id, score), best first. Chunks sharing no term are never returned,
+        nor are rows outside `mask`.
+        """
+        if top_n <= 0:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            lo, hi = self.offsets[t], self.offsets[t + 1]
+            docs = self.postings[lo:hi]
+            tf = self.tfs[lo:hi].astype(np.float32)
+            scores[docs] += self._idf[t] * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+
+        if mask is not None:
+            scores[~mask] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_n:
+            hits = hits[np.argpartition(-scores[hits], top_n - 1)[:top_n]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in hits]
+
+    def reference_chunks(self, query: str, top_k: int, mask: Optional[np.ndarray] = None) -> Optional[List[str]]:
+        """
+        Chunk ids for the article/recital references named in `query` (taken round-robin
+        across references, up to top_k), or None if there is none or one is not indexed
+        (within `mask`).
+        """
+        refs = structural_refs(query)
+        if not refs or any(r not in self.refs for r in refs):
+            return None
+        lists = [self.refs[r] for r in refs]
+        if mask is not None:
+            lists = [[cid for cid in lst if mask[self._pos[cid]]] for lst in lists]
+            if not all(lists):
+                return None
+        out: List[str] = []
+        for i in range(max(len(lst) for lst in lists)):
+            for lst in lists:
+                if i < len(lst) and lst[i] not in out:
+                    out.append(lst[i])
+        return out[:top_k]
+
+
+# Loaded indexes, reloaded when the file changes (ingest in another process, version swap).
+_CACHE: Dict[str, Tuple[int, LexicalIndex]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def build_lexical_index(collection, persist_path: str, collection_name: str) -> LexicalIndex:
+    """
+    (Re)builds the index from everything currently in `collection` and persists it.
+    """
+    data = collection.get(include=["documents", "metadatas"])
+    index = LexicalIndex.build(data["ids"], data["documents"] or [], data["metadatas"] or [])
+    index.save(lexical_index_path(persist_path, collection_name))
+    with _CACHE_LOCK:
+        _CACHE.pop(str(lexical_index_path(persist_path, collection_name)), None)
+    return index
+
+
+def get_lexical_index(persist_path: str, collection_name: str) -> Optional[LexicalIndex]:
+    path = lexical_index_path(persist_path, collection_name)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = str(path)
+    with _CACHE_LOCK:
+        cached = _CACHE.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    index = LexicalIndex.load(path)
+    if index is None:
+        return None  # older format: rebuilt on the next ingest
+    with _CACHE_LOCK:
+        _CACHE[key] = (mtime, index)
+    return index
@@ -0,0 +1,96 @@
+# rag/manifest.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def manifest_path(persist_path: str, collection_name: str) -> Path:
+    """
+    One manifest per physical collection, stored next to the vector store data.
+    """
+    return Path(persist_path) / "manifests" / f"{collection_name}.json"
+
+
+def delete_manifest(persist_path: str, collection_name: str) -> None:
+    manifest_path(persist_path, collection_name).unlink(missing_ok=True)
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IngestManifest:
+    """
+    Records what has been ingested per source:
+
+    {"<source>": {"sha256": ..., "size": ..., "mtime_ns": ...,
+                  "params": {"chunk_size": ..., "chunk_overlap": ...},
+                  "ids": [...], "chunk_sha256": [...], "dir": ...}}
+
+    `ids[i]` and `chunk_sha256[i]` describe chunk i of the source, so a re-ingest
+    can upsert only the chunks whose text changed and delete the ones that are gone.
+    "dir" is set for sources ingested by ingest_pdf_dir, so PDFs removed from that
+    directory can be dropped without touching uploads or single-file ingests.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            self.sources = json.loads(path.read_text(encoding="utf-8"))
+
+    @classmethod
+    def for_collection(cls, persist_path: str, collection_name: str) -> "IngestManifest":
+        return cls(manifest_path(persist_path, collection_name))
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.sources.get(source)
+
+    def set(self, source: str, entry: Dict[str, Any]) -> None:
+        self.sources[source] = entry
+
+    def remove(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.sources.pop(source, None)
+
+    def matches(self, source: str, sha256: str, params: Dict[str, Any]) -> bool:
+        """
+        True if `source` was ingested from content with this hash and these params.
+        """
+        entry = self.get(source)
+        return entry is not None and entry.get("params") == params and entry.get("sha256") == sha256
+
+    def is_unchanged(self, source: str, path: Path, params: Dict[str, Any]) -> bool:
+        """
+        True if `path` was already ingested with the same params.
+        size+mtime match is the O(1) fast path; otherwise fall back to the content hash.
+        """
+        entry = self.get(source)
+        if entry is None or entry.get("params") != params:
+            return False
+
+        st = path.stat()
+        if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return True
+
+        if entry.get("sha256") == file_sha256(path):
+            # Touched but identical: remember the new mtime so next time is O(1) again.
+            entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            self.save()
+            return True
+        return False
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name: another process may be saving the same manifest right now.
+        tmp = self.path.with_suffix(f".json.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(self.sources, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
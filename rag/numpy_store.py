@@ -0,0 +1,297 @@
+# rag/numpy_store.py
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rag.filters import where_matches, where_sources
+
+_EMBEDDINGS_FILE = "embeddings.f32"
+_SIDECAR_FILE = "sidecar.json"
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class NumpyCollection:
+    """
+    Minimal vector index for small corpora (a few hundred to ~100k chunks).
+
+    Layout under `<persist_path>/numpy/<collection_name>/`:
+    - embeddings.f32: row-major float32 matrix of unit-normalized vectors (memory-mapped)
+    - sidecar.json:   dim + ids/documents/metadatas, row-aligned with the matrix
+
+    It implements the subset of chromadb's Collection API the rag package uses
+    (add/upsert/get/query/delete/count), with the same result shapes, so callers
+    don't care which backend they got. Distances are cosine distances (1 - cos),
+    the space get_collection() creates Chroma collections in.
+    """
+
+    def __init__(self, root: Path, name: str, embedding_function=None) -> None:
+        self.name = name
+        self._dir = Path(root) / name
+        self._ef = embedding_function
+        self._lock = threading.RLock()
+        self._sidecar_mtime: Optional[int] = None
+        self._load()
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def _load(self) -> None:
+        sidecar = self._dir / _SIDECAR_FILE
+        if sidecar.exists():
+            data = json.loads(sidecar.read_text(encoding="utf-8"))
+            self._sidecar_mtime = sidecar.stat().st_mtime_ns
+        else:
+            data = {"dim": 0, "ids": [], "documents": [], "metadatas": []}
+            self._sidecar_mtime = None
+
+        self._dim: int = int(data["dim"])
+        self._ids: List[str] = list(data["ids"])
+        self._documents: List[Optional[str]] = list(data["documents"])
+        self._metadatas: List[Optional[Dict[str, Any]]] = list(data["metadatas"])
+        self._pos: Dict[str, int] = {i: n for n, i in enumerate(self._ids)}
+        self._source_rows: Optional[Dict[Any, List[int]]] = None
+        self._matrix = self._open_matrix("r")
+
+    def _open_matrix(self, mode: str) -> Optional[np.memmap]:
+        n = len(self._ids)
+        if n == 0 or self._dim == 0:
+            return None
+        return np.memmap(self._dir / _EMBEDDINGS_FILE, dtype=np.float32, mode=mode, shape=(n, self._dim))
+
+    def _maybe_reload(self) -> None:
+        # Another process (e.g. `python -m rag.ingest`) may have written the index.
+        sidecar = self._dir / _SIDECAR_FILE
+        mtime = sidecar.stat().st_mtime_ns if sidecar.exists() else None
+        if mtime != self._sidecar_mtime:
+            self._load()
+
+    def _write_sidecar(self) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        data = {
+            "dim": self._dim,
+            "ids": self._ids,
+            "documents": self._documents,
+            "metadatas": self._metadatas,
+        }
+        tmp = self._dir / (_SIDECAR_FILE + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self._dir / _SIDECAR_FILE)
+        self._sidecar_mtime = (self._dir / _SIDECAR_FILE).stat().st_mtime_ns
+        self._source_rows = None
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+    def _embed(self, documents: Sequence[str]) -> np.ndarray:
+        if self._ef is None:
+            raise ValueError("No embedding function configured; pass embeddings= explicitly.")
+        return np.asarray(self._ef(list(documents)), dtype=np.float32)
+
+    def add(
+        self,
+        ids: Sequence[str],
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+    ) -> None:
+        with self._lock:
+            self._maybe_reload()
+            dup = [i for i in ids if i in self._pos]
+            if dup:
+                raise ValueError(f"IDs already exist in collection {self.name}: {dup[:5]}")
+            self._write(ids, documents, metadatas, embeddings)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+    ) -> None:
+        with self._lock:
+            self._maybe_reload()
+            self._write(ids, documents, metadatas, embeddings)
+
+    def _write(self, ids, documents, metadatas, embeddings) -> None:
+        ids = [str(i) for i in ids]
+        if not ids:
+            return
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+
+        if embeddings is None:
+            vecs = self._embed(documents)
+        else:
+            vecs = np.asarray(embeddings, dtype=np.float32)
+        vecs = _normalize_rows(vecs.reshape(len(ids), -1))
+
+        if self._dim == 0:
+            self._dim = int(vecs.shape[1])
+        elif vecs.shape[1] != self._dim:
+            raise ValueError(f"Embedding dimension {vecs.shape[1]} != collection dimension {self._dim}")
+
+        self._dir.mkdir(parents=True, exist_ok=True)
+
+        # Existing ids are overwritten in place; new ids are appended.
+        existing = [(n, self._pos[i]) for n, i in enumerate(ids) if i in self._pos]
+        if existing and self._matrix is not None:
+            mm = self._open_matrix("r+")
+            for n, row in existing:
+                mm[row] = vecs[n]
+                self._documents[row] = documents[n]
+                self._metadatas[row] = metadatas[n]
+            mm.flush()
+            del mm
+
+        new_rows = [n for n, i in enumerate(ids) if i not in self._pos]
+        if new_rows:
+            path = self._dir / _EMBEDDINGS_FILE
+            with open(path, "ab") as f:
+                # Drop rows left behind by an interrupted write (not referenced by the sidecar).
+                f.truncate(len(self._ids) * self._dim * 4)
+                f.write(np.ascontiguousarray(vecs[new_rows]).tobytes())
+            for n in new_rows:
+                self._pos[ids[n]] = len(self._ids)
+                self._ids.append(ids[n])
+                self._documents.append(documents[n])
+                self._metadatas.append(metadatas[n])
+
+        self._write_sidecar()
+        self._matrix = self._open_matrix("r")
+
+    def delete(self, ids: Optional[Sequence[str]] = None) -> None:
+        with self._lock:
+            self._maybe_reload()
+            drop = {str(i) for i in (ids or [])} & self._pos.keys()
+            if not drop:
+                return
+            keep = [n for n, i in enumerate(self._ids) if i not in drop]
+            matrix = np.array(self._matrix[keep]) if self._matrix is not None else np.zeros((0, self._dim), np.float32)
+
+            self._ids = [self._ids[n] for n in keep]
+            self._documents = [self._documents[n] for n in keep]
+            self._metadatas = [self._metadatas[n] for n in keep]
+            self._pos = {i: n for n, i in enumerate(self._ids)}
+
+            self._matrix = None
+            tmp = self._dir / (_EMBEDDINGS_FILE + ".tmp")
+            tmp.write_bytes(np.ascontiguousarray(matrix).tobytes())
+            os.replace(tmp, self._dir / _EMBEDDINGS_FILE)
+            self._write_sidecar()
+            self._matrix = self._open_matrix("r")
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._ids)
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_reload()
+            if ids is None:
+                rows = list(range(len(self._ids)))
+            else:
+                rows = [self._pos[str(i)] for i in ids if str(i) in self._pos]
+            if where:
+                allowed = set(self._filter_rows(where).tolist())
+                rows = [r for r in rows if r in allowed]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._rows_payload(rows, include)
+
+    def _filter_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        Rows matching a Chroma-style `where`. A source restriction is resolved from a
+        per-source row index first, so filtering to one document only scans that document.
+        """
+        sources = where_sources(where)
+        if sources is None:
+            candidates: Sequence[int] = range(len(self._ids))
+        else:
+            if self._source_rows is None:
+                self._source_rows = {}
+                for n, meta in enumerate(self._metadatas):
+                    self._source_rows.setdefault((meta or {}).get("source"), []).append(n)
+            candidates = sorted(r for src in sources for r in self._source_rows.get(src, []))
+        keep = [r for r in candidates if where_matches(where, self._metadatas[r])]
+        return np.asarray(keep, dtype=np.int64)
+
+    def _rows_payload(self, rows: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+        out["documents"] = [self._documents[r] for r in rows] if "documents" in include else None
+        out["metadatas"] = [self._metadatas[r] for r in rows] if "metadatas" in include else None
+        if "embeddings" in include and self._matrix is not None:
+            out["embeddings"] = np.array(self._matrix[rows])
+        else:
+            out["embeddings"] = None
+        return out
+
+    def query(
+        self,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        query_texts: Optional[Sequence[str]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict[str, Any]:
+        """
+        Batch top-k: one (m x d) @ (d x n) matmul for all queries, then argpartition per row.
+        With `where`, only the matching rows take part in the matmul.
+        """
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("Provide query_embeddings or query_texts.")
+            q = self._embed(query_texts)
+        else:
+            q = np.asarray(query_embeddings, dtype=np.float32)
+        q = _normalize_rows(q.reshape(q.shape[0] if q.ndim > 1 else 1, -1))
+
+        with self._lock:
+            self._maybe_reload()
+            out: Dict[str, Any] = {k: [] for k in ("ids", "documents", "metadatas", "distances", "embeddings")}
+            rows = self._filter_rows(where) if where and self._matrix is not None else None
+            n = len(self._ids) if rows is None else len(rows)
+            if n == 0 or self._matrix is None:
+                for _ in range(q.shape[0]):
+                    for k in out:
+                        out[k].append([])
+                return out
+
+            matrix = self._matrix if rows is None else self._matrix[rows]
+            sims = q @ matrix.T  # (m, n)
+            k = min(n_results, n)
+            for row in sims:
+                top = np.argpartition(-row, k - 1)[:k] if k < n else np.arange(n)
+                top = top[np.argsort(-row[top], kind="stable")]
+                payload = self._rows_payload((top if rows is None else rows[top]).tolist(), include)
+                out["ids"].append(payload["ids"])
+                out["documents"].append(payload["documents"] or [])
+                out["metadatas"].append(payload["metadatas"] or [])
+                out["distances"].append([float(1.0 - row[t]) for t in top])
+                out["embeddings"].append(payload["embeddings"] if payload["embeddings"] is not None else [])
+            return out
+
+
+def delete_numpy_collection(root: Path, name: str) -> None:
+    shutil.rmtree(Path(root) / name, ignore_errors=True)
@@ -0,0 +1,209 @@
+# rag/openai_client.py
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+T = TypeVar("T")
+
+# Timeouts (seconds). The read timeout applies per chunk, so it also bounds stalls in streams.
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+OPENAI_CONNECT_TIMEOUT_S = float(os.getenv("OPENAI_CONNECT_TIMEOUT_S", "5"))
+# Keep-alive pool shared by every call in the process.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+# Retries on 429/5xx/connection errors: full-jitter exponential backoff unless the
+# server sends Retry-After, which wins (capped at OPENAI_RETRY_AFTER_MAX_S).
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE_S = float(os.getenv("OPENAI_BACKOFF_BASE_S", "0.5"))
+OPENAI_BACKOFF_MAX_S = float(os.getenv("OPENAI_BACKOFF_MAX_S", "20"))
+OPENAI_RETRY_AFTER_MAX_S = float(os.getenv("OPENAI_RETRY_AFTER_MAX_S", "60"))
+
+_LOCK = threading.Lock()
+_CLIENTS: Dict[str, OpenAI] = {}
+# AsyncOpenAI's connection pool belongs to the event loop it was first used on.
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+_STATS: Dict[str, Any] = {"calls": 0, "retries": 0, "failures": 0, "retry_sleep_s": 0.0, "by_reason": {}}
+
+
+def get_openai_api_key(env_name: str = "OPENAI_API_KEY") -> str:
+    key = os.getenv(env_name)
+    if not key:
+        raise RuntimeError(
+            f"Missing {env_name}. Set it in your environment or .env file."
+        )
+    return key
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE)
+
+
+def get_openai_client(api_key_env: str = "OPENAI_API_KEY") -> OpenAI:
+    """
+    Process-wide OpenAI client (thread-safe), so every call reuses pooled keep-alive
+    connections instead of paying DNS/TLS setup again. SDK retries are off:
+    wrap calls in with_retries() (or use chat_completion()).
+    """
+    with _LOCK:
+        client = _CLIENTS.get(api_key_env)
+        if client is None:
+            client = OpenAI(
+                api_key=get_openai_api_key(api_key_env),
+                timeout=_timeout(),
+                max_retries=0,
+                http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+            )
+            _CLIENTS[api_key_env] = client
+        return client
+
+
+def get_async_openai_client(api_key_env: str = "OPENAI_API_KEY") -> AsyncOpenAI:
+    """
+    Returns an AsyncOpenAI client shared by every coroutine on the running event loop.
+    Must be called from inside a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        per_loop = _ASYNC_CLIENTS.setdefault(loop, {})
+        client = per_loop.get(api_key_env)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=get_openai_api_key(api_key_env),
+                timeout=_timeout(),
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+            )
+            per_loop[api_key_env] = client
+        return client
+
+
+def _retry_reason(err: Exception) -> Optional[str]:
+    """
+    Why `err` is worth retrying ("429", "5xx", "timeout", "connection"), or None.
+    """
+    if isinstance(err, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(err, openai.APIConnectionError):
+        return "connection"
+    if isinstance(err, openai.APIStatusError):
+        if err.status_code == 429:
+            return "429"
+        if err.status_code >= 500:
+            return "5xx"
+    return None
+
+
+def _retry_after_s(err: Exception) -> Optional[float]:
+    response = getattr(err, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        raw = headers.get("retry-after")
+        if not raw:
+            return None
+        try:
+            return float(raw)
+        except ValueError:
+            # HTTP-date form
+            return parsedate_to_datetime(raw).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def _next_delay(err: Exception, attempt: int) -> Optional[float]:
+    """
+    Seconds to wait before retry number `attempt + 1`, or None to give up (and count it).
+    """
+    reason = _retry_reason(err)
+    with _LOCK:
+        if reason is None or attempt >= OPENAI_MAX_RETRIES:
+            _STATS["failures"] += 1
+            return None
+        retry_after = _retry_after_s(err)
+        if retry_after is not None:
+            delay = min(max(0.0, retry_after), OPENAI_RETRY_AFTER_MAX_S)
+        else:
+            delay = random.uniform(0.0, min(OPENAI_BACKOFF_MAX_S, OPENAI_BACKOFF_BASE_S * (2 ** attempt)))
+        _STATS["retries"] += 1
+        _STATS["retry_sleep_s"] += delay
+        _STATS["by_reason"][reason] = _STATS["by_reason"].get(reason, 0) + 1
+        return delay
+
+
+def _count_call() -> None:
+    with _LOCK:
+        _STATS["calls"] += 1
+
+
+def with_retries(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Calls fn(*args, **kwargs), retrying on 429/5xx/timeouts/connection errors.
+    For streams only opening the stream is retried (errors come back before the first token).
+    """
+    _count_call()
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            delay = _next_delay(e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+async def with_retries_async(fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+    """
+    Async with_retries(): same policy, waits with asyncio.sleep.
+    """
+    _count_call()
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            delay = _next_delay(e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def chat_completion(*, api_key_env: str = "OPENAI_API_KEY", **kwargs: Any) -> Any:
+    """
+    client.chat.completions.create(**kwargs) on the shared client, with retries.
+    """
+    return with_retries(get_openai_client(api_key_env).chat.completions.create, **kwargs)
+
+
+async def chat_completion_async(*, api_key_env: str = "OPENAI_API_KEY", **kwargs: Any) -> Any:
+    return await with_retries_async(get_async_openai_client(api_key_env).chat.completions.create, **kwargs)
+
+
+def openai_client_stats() -> Dict[str, Any]:
+    """
+    Call/retry counters since start-up (for logs/monitoring).
+    """
+    with _LOCK:
+        return {**_STATS, "by_reason": dict(_STATS["by_reason"]), "retry_sleep_s": round(_STATS["retry_sleep_s"], 3)}
@@ -0,0 +1,113 @@
+# rag/parse_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Extracted page text and chunk lists, so re-ingests and ablation sweeps skip pypdf.
+# Empty INGEST_CACHE_DIR disables the cache.
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", "/tmp/rag_ingest_cache")
+# Past this many files (pages + chunk lists), the least recently used ones are deleted (0 = unbounded).
+INGEST_CACHE_MAX_ENTRIES = int(os.getenv("INGEST_CACHE_MAX_ENTRIES", "2000"))
+
+
+def pages_sha256(pages: Iterable[str]) -> str:
+    """
+    Hash of the document text as the chunker sees it ("\\n".join(pages)).
+    """
+    h = hashlib.sha256()
+    for i, page in enumerate(pages):
+        if i:
+            h.update(b"\n")
+        h.update(page.encode("utf-8"))
+    return h.hexdigest()
+
+
+def chunks_key(
+    text_sha256: str,
+    *,
+    chunk_size: int,
+    chunk_overlap: int,
+    separators: Sequence[str],
+    chunker: str,
+) -> str:
+    raw = json.dumps([text_sha256, chunk_size, chunk_overlap, list(separators), chunker])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _path(kind: str, key: str, cache_dir: Optional[str]) -> Optional[Path]:
+    root = INGEST_CACHE_DIR if cache_dir is None else cache_dir
+    if not root:
+        return None
+    return Path(root) / kind / f"{key}.json"
+
+
+def _load(kind: str, key: str, cache_dir: Optional[str]) -> Optional[list]:
+    path = _path(kind, key, cache_dir)
+    if path is None or not path.exists():
+        return None
+    try:
+        value = json.loads(path.read_text(encoding="utf-8"))
+        os.utime(path)  # mtime doubles as "last used" for eviction
+        return value
+    except (OSError, ValueError):
+        return None  # partial/corrupt/just evicted entry: treat as a miss
+
+
+def _evict(root: Path, max_entries: int) -> int:
+    """
+    Deletes the least recently used entries until at most `max_entries` are left.
+    """
+    if max_entries <= 0:
+        return 0
+    entries = []
+    for path in root.glob("*/*.json"):
+        try:
+            entries.append((path.stat().st_mtime_ns, path))
+        except OSError:
+            pass  # removed by another process meanwhile
+    overflow = len(entries) - max_entries
+    if overflow <= 0:
+        return 0
+    entries.sort()
+    for _, path in entries[:overflow]:
+        path.unlink(missing_ok=True)
+    return overflow
+
+
+def _save(kind: str, key: str, value: list, cache_dir: Optional[str]) -> None:
+    path = _path(kind, key, cache_dir)
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # unique tmp name: several ingest worker processes may write the same key
+    tmp = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+    _evict(path.parent.parent, INGEST_CACHE_MAX_ENTRIES)
+
+
+def load_pages(pdf_sha256: str, *, cache_dir: Optional[str] = None) -> Optional[List[Tuple[int, str]]]:
+    """
+    Returns [(page_number, text), ...] for non-empty pages, or None on a miss.
+    """
+    pages = _load("pages", pdf_sha256, cache_dir)
+    if pages is None or any(not isinstance(p, list) or len(p) != 2 for p in pages):
+        return None  # missing or written in an older format
+    return [(int(n), str(t)) for n, t in pages]
+
+
+def save_pages(pdf_sha256: str, pages: List[Tuple[int, str]], *, cache_dir: Optional[str] = None) -> None:
+    _save("pages", pdf_sha256, [list(p) for p in pages], cache_dir)
+
+
+def load_chunks(key: str, *, cache_dir: Optional[str] = None) -> Optional[list]:
+    return _load("chunks", key, cache_dir)
+
+
+def save_chunks(key: str, chunks: list, *, cache_dir: Optional[str] = None) -> None:
+    _save("chunks", key, chunks, cache_dir)
@@ -1,10 +1,49 @@
 # rag/retriever.py
 from __future__ import annotations
 
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from rag.store import VectorStoreConfig, get_collection
+import numpy as np
+
+from rag.context import pack_context
+from rag.embedding_cache import get_embedding_cache, text_sha256
+from rag.filters import RetrievalFilter
+from rag.lexical import LexicalIndex, get_lexical_index
+from rag.openai_client import get_async_openai_client, with_retries_async
+from rag.store import (
+    VectorStoreConfig,
+    distance_space,
+    get_collection,
+    get_embedding_function,
+    physical_config,
+    to_cosine_distance,
+)
+
+
+# Optional two-stage retrieval: fetch MMR_FETCH_K candidates, keep top_k by Maximal Marginal Relevance.
+MMR_ENABLED = os.getenv("RETRIEVAL_MMR", "0") == "1"
+MMR_FETCH_K = int(os.getenv("RETRIEVAL_MMR_FETCH_K", "20"))
+MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))  # 1.0 = pure relevance
+
+# Adaptive top_k: top_k becomes the maximum; the list is cut at the largest relative
+# distance gap (if at least ADAPTIVE_MIN_GAP) and/or at a distance ceiling, keeping >= ADAPTIVE_MIN_K.
+ADAPTIVE_ENABLED = os.getenv("RETRIEVAL_ADAPTIVE", "0") == "1"
+ADAPTIVE_MIN_K = int(os.getenv("RETRIEVAL_ADAPTIVE_MIN_K", "1"))
+ADAPTIVE_MIN_GAP = float(os.getenv("RETRIEVAL_ADAPTIVE_MIN_GAP", "0.1"))
+_max_distance = os.getenv("RETRIEVAL_ADAPTIVE_MAX_DISTANCE", "").strip()
+ADAPTIVE_MAX_DISTANCE: Optional[float] = float(_max_distance) if _max_distance else None
+
+# Lexical index (built at ingest, see rag.lexical): "Article 17"-style queries are answered
+# from it without an embedding call; other queries fuse dense and BM25 ranks (RRF).
+LEXICAL_RETRIEVAL = os.getenv("RETRIEVAL_LEXICAL", "1") == "1"
+HYBRID_POOL = int(os.getenv("RETRIEVAL_HYBRID_POOL", "20"))  # BM25 candidates per query
+RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
 
 
 @dataclass(frozen=True)
@@ -20,59 +59,574 @@ class Chunk:
     metadata: Dict[str, Any]
 
 
+class QueryEmbeddingCache:
+    """
+    Thread-safe in-memory LRU cache of query vectors with a TTL.
+    Keys are (embedding_model, normalized query text).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_s: float = 3600.0) -> None:
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl_s <= 0 or time.monotonic() - item[0] < self.ttl_s):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]  # expired
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, str], vector: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), vector)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_QUERY_CACHES: Dict[Tuple[int, float], QueryEmbeddingCache] = {}
+_QUERY_CACHES_LOCK = threading.Lock()
+
+
+def _get_query_cache(config: VectorStoreConfig) -> QueryEmbeddingCache:
+    key = (config.query_cache_size, config.query_cache_ttl_s)
+    with _QUERY_CACHES_LOCK:
+        cache = _QUERY_CACHES.get(key)
+        if cache is None:
+            cache = QueryEmbeddingCache(max_size=config.query_cache_size, ttl_s=config.query_cache_ttl_s)
+            _QUERY_CACHES[key] = cache
+        return cache
+
+
+def query_cache_stats(config: VectorStoreConfig = VectorStoreConfig()) -> Dict[str, Any]:
+    return _get_query_cache(config).stats()
+
+
+def _normalize_query(query: str) -> str:
+    # Whitespace-only normalization: casing can change the embedding, so we keep it.
+    return " ".join(query.split())
+
+
+def embed_query(query: str, *, config: VectorStoreConfig = VectorStoreConfig()) -> List[float]:
+    """
+    Returns the embedding of `query`, served from the in-memory cache when possible.
+    """
+    return embed_queries([query], config=config)[0]
+
+
+def _cached_vectors(texts: List[str], cache: QueryEmbeddingCache, config: VectorStoreConfig) -> Dict[str, List[float]]:
+    vectors: Dict[str, List[float]] = {}
+    for t in texts:
+        if t not in vectors:
+            vec = cache.get((config.embedding_model, t))
+            if vec is not None:
+                vectors[t] = vec
+    return vectors
+
+
+def embed_queries(queries: List[str], *, config: VectorStoreConfig = VectorStoreConfig()) -> List[List[float]]:
+    """
+    Embeds many queries; cache misses are sent in ONE embedding request.
+    """
+    texts = [_normalize_query(q) for q in queries]
+    cache = _get_query_cache(config)
+    vectors = _cached_vectors(texts, cache, config)
+
+    missing = [t for t in dict.fromkeys(texts) if t not in vectors]
+    if missing:
+        ef = get_embedding_function(config)
+        for t, v in zip(missing, ef(missing)):
+            vec = [float(x) for x in v]
+            cache.put((config.embedding_model, t), vec)
+            vectors[t] = vec
+
+    return [vectors[t] for t in texts]
+
+
+async def _embed_async(texts: List[str], config: VectorStoreConfig) -> List[List[float]]:
+    # Same two tiers as the sync embedding function: on-disk cache first, then OpenAI.
+    disk = None
+    found: Dict[str, Any] = {}
+    hashes = [text_sha256(t) for t in texts]
+    if config.embedding_cache_path:
+        disk = get_embedding_cache(config.embedding_cache_path, max_entries=config.embedding_cache_max_entries)
+        found = await asyncio.to_thread(disk.get_many, config.embedding_model, hashes)
+
+    todo = [(h, t) for h, t in zip(hashes, texts) if h not in found]
+    if todo:
+        client = get_async_openai_client(config.openai_api_key_env)
+        resp = await with_retries_async(
+            client.embeddings.create, model=config.embedding_model, input=[t for _, t in todo]
+        )
+        fresh = {h: d.embedding for (h, _), d in zip(todo, sorted(resp.data, key=lambda d: d.index))}
+        if disk is not None:
+            await asyncio.to_thread(
+                disk.put_many, config.embedding_model, {h: np.asarray(v, dtype=np.float32) for h, v in fresh.items()}
+            )
+        found.update(fresh)
+
+    return [[float(x) for x in found[h]] for h in hashes]
+
+
+async def embed_queries_async(
+    queries: List[str],
+    *,
+    config: VectorStoreConfig = VectorStoreConfig(),
+) -> List[List[float]]:
+    """
+    Async embed_queries(): cache misses go out in ONE AsyncOpenAI embeddings request.
+    """
+    texts = [_normalize_query(q) for q in queries]
+    cache = _get_query_cache(config)
+    vectors = _cached_vectors(texts, cache, config)
+
+    missing = [t for t in dict.fromkeys(texts) if t not in vectors]
+    if missing:
+        for t, vec in zip(missing, await _embed_async(missing, config)):
+            cache.put((config.embedding_model, t), vec)
+            vectors[t] = vec
+
+    return [vectors[t] for t in texts]
+
+
+def _result_row(results: Dict[str, Any], key: str, row: int) -> list:
+    values = results.get(key)
+    if values is None or row >= len(values):
+        return []
+    return values[row]
+
+
+def _to_chunks(results: Dict[str, Any], row: int) -> List[Chunk]:
+    """
+    Converts row `row` of a (batched) collection.query() result into Chunks.
+    """
+    docs = _result_row(results, "documents", row)
+    metas = _result_row(results, "metadatas", row)
+    dists = _result_row(results, "distances", row)
+    ids = _result_row(results, "ids", row)
+
+    return [_make_chunk(_id, doc, meta, dist) for doc, meta, dist, _id in zip(docs, metas, dists, ids)]
+
+
+def _make_chunk(_id: Any, doc: Any, meta: Optional[Dict[str, Any]], dist: Optional[float]) -> Chunk:
+    meta = meta or {}
+    return Chunk(
+        id=str(_id),
+        text=str(doc),
+        source=meta.get("source"),
+        chunk_index=meta.get("chunk_index"),
+        distance=float(dist) if dist is not None else None,
+        metadata=dict(meta),
+    )
+
+
+def rrf_fuse(rankings: List[List[str]], *, k: int = RRF_K) -> List[str]:
+    """
+    Reciprocal rank fusion: ids ordered by sum(1 / (k + rank)). Ties keep first-seen order.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda cid: -scores[cid])
+
+
+def mmr_select(query_embedding: Any, candidate_embeddings: Any, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Greedy Maximal Marginal Relevance over cosine similarity.
+    Returns positions of the selected candidates, in selection order.
+    """
+    cands = np.asarray(candidate_embeddings, dtype=np.float32)
+    if cands.ndim != 2 or len(cands) == 0 or k <= 0:
+        return []
+    cands = cands / np.maximum(np.linalg.norm(cands, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_embedding, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+    relevance = cands @ q
+    pairwise = cands @ cands.T  # one similarity matrix for the whole pool
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = pairwise[first].copy()  # max similarity to anything selected so far
+    available = np.ones(len(cands), dtype=bool)
+    available[first] = False
+
+    while len(selected) < min(k, len(cands)):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        j = int(np.argmax(scores))
+        selected.append(j)
+        available[j] = False
+        np.maximum(redundancy, pairwise[j], out=redundancy)
+    return selected
+
+
+def adaptive_k(
+    distances: List[float],
+    *,
+    min_k: int = ADAPTIVE_MIN_K,
+    min_gap: float = ADAPTIVE_MIN_GAP,
+    max_distance: Optional[float] = ADAPTIVE_MAX_DISTANCE,
+) -> int:
+    """
+    How many of the (ascending) `distances` to keep.
+
+    Cuts before the largest relative gap d[i+1]/d[i] - 1 when it is at least `min_gap`,
+    then drops anything above `max_distance`; never returns fewer than `min_k`
+    (or more than len(distances)).
+    """
+    n = len(distances)
+    if n == 0:
+        return 0
+    floor = max(1, min(min_k, n))
+
+    k = n
+    if n > 1:
+        d = np.asarray(distances, dtype=np.float64)
+        gaps = (d[1:] - d[:-1]) / np.maximum(d[:-1], 1e-9)
+        i = int(np.argmax(gaps))
+        if gaps[i] >= min_gap:
+            k = i + 1
+
+    if max_distance is not None:
+        k = min(k, sum(1 for x in distances if x <= max_distance))
+    return max(floor, k)
+
+
 def retrieve(
     query: str,
     *,
     top_k: int = 4,
     config: VectorStoreConfig = VectorStoreConfig(),
+    mmr: Optional[bool] = None,
+    fetch_k: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+    adaptive: Optional[bool] = None,
+    lexical: Optional[bool] = None,
+    filters: Optional[RetrievalFilter] = None,
+    timings: Optional[Dict[str, float]] = None,
 ) -> List[Chunk]:
     """
     Retrieve top_k chunks for a query from Chroma.
 
     Returns a list of Chunk objects with ids + metadata for debugging and citations.
+    With `mmr` (default: RETRIEVAL_MMR), `fetch_k` nearest neighbours are re-ranked by
+    Maximal Marginal Relevance so near-duplicate chunks don't fill all top_k slots.
+    With `adaptive` (default: RETRIEVAL_ADAPTIVE), top_k is only an upper bound; see adaptive_k().
+    `lexical` toggles the exact-reference fast path and BM25 fusion (see retrieve_many).
+    `filters` restricts the search (source, chunk_index range, metadata predicates) inside the store.
+    Pass a dict as `timings` to get the time spent embedding vs searching (embed_ms, search_ms).
     """
-    if not query or not query.strip():
-        return []
+    return retrieve_many(
+        [query],
+        top_k=top_k,
+        config=config,
+        mmr=mmr,
+        fetch_k=fetch_k,
+        mmr_lambda=mmr_lambda,
+        adaptive=adaptive,
+        lexical=lexical,
+        filters=filters,
+        timings=timings,
+    )[0]
+
+
+def retrieve_many(
+    queries: List[str],
+    *,
+    top_k: int = 4,
+    config: VectorStoreConfig = VectorStoreConfig(),
+    mmr: Optional[bool] = None,
+    fetch_k: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+    adaptive: Optional[bool] = None,
+    lexical: Optional[bool] = None,
+    filters: Optional[RetrievalFilter] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[List[Chunk]]:
+    """
+    Batched retrieve(): one embedding request and one store query for all queries.
+    Returns one Chunk list per query (empty for blank queries), in input order.
+
+    With `lexical` (default: RETRIEVAL_LEXICAL) and a lexical index on disk, queries naming
+    an article/recital skip the embedding call entirely (their chunks have distance=None)
+    and the others get dense + BM25 rank fusion.
+    """
+    out: List[List[Chunk]] = [[] for _ in queries]
+    live = [i for i, q in enumerate(queries) if q and q.strip()]
+    if not live:
+        return out
+
+    plan = _RetrievalPlan.build(top_k, mmr, fetch_k, mmr_lambda, adaptive, lexical, filters)
+    t0 = time.perf_counter()
+    lex, fast = _lexical_fast_path(queries, live, plan, config)
+    dense = [i for i in live if i not in fast]
+    t1 = time.perf_counter()
+    query_embeddings = embed_queries([queries[i] for i in dense], config=config) if dense else []
+    t2 = time.perf_counter()
+    found = _search(queries, dense, query_embeddings, fast, lex, plan, config)
+    _record_timings(timings, t0, t1, t2, time.perf_counter())
+
+    for i, chunks in found.items():
+        out[i] = chunks
+    return out
+
+
+def _record_timings(timings: Optional[Dict[str, float]], t0: float, t1: float, t2: float, t3: float) -> None:
+    # t0..t1 lexical fast path, t1..t2 query embedding, t2..t3 store query + fusion
+    if timings is not None:
+        timings["embed_ms"] = (t2 - t1) * 1000.0
+        timings["search_ms"] = ((t1 - t0) + (t3 - t2)) * 1000.0
+
+
+@dataclass(frozen=True)
+class _RetrievalPlan:
+    top_k: int
+    mmr: bool
+    fetch_k: int
+    mmr_lambda: float
+    adaptive: bool
+    lexical: bool
+    filters: Optional[RetrievalFilter]
+    where: Optional[Dict[str, Any]]
+
+    @classmethod
+    def build(
+        cls,
+        top_k: int,
+        mmr: Optional[bool],
+        fetch_k: Optional[int],
+        mmr_lambda: Optional[float],
+        adaptive: Optional[bool],
+        lexical: Optional[bool],
+        filters: Optional[RetrievalFilter],
+    ) -> "_RetrievalPlan":
+        use_mmr = MMR_ENABLED if mmr is None else mmr
+        pool = max(top_k, MMR_FETCH_K if fetch_k is None else fetch_k)
+        return cls(
+            top_k=top_k,
+            mmr=use_mmr and pool > top_k,  # nothing to diversify otherwise
+            fetch_k=pool,
+            mmr_lambda=MMR_LAMBDA if mmr_lambda is None else mmr_lambda,
+            adaptive=ADAPTIVE_ENABLED if adaptive is None else adaptive,
+            lexical=LEXICAL_RETRIEVAL if lexical is None else lexical,
+            filters=filters,
+            where=filters.to_where() if filters is not None else None,
+        )
 
+    def chunks(self, results: Dict[str, Any], row: int, query_embedding: List[float]) -> List[Chunk]:
+        candidates = _to_chunks(results, row)  # nearest first
+        k = self.top_k
+        if self.adaptive:
+            nearest = candidates[: self.top_k]
+            if all(c.distance is not None for c in nearest):
+                k = adaptive_k([c.distance for c in nearest])
+        if not self.mmr:
+            return candidates[:k]
+        embeddings = _result_row(results, "embeddings", row)
+        order = mmr_select(query_embedding, embeddings, k, self.mmr_lambda)
+        return [candidates[j] for j in order]
+
+
+def _lexical_fast_path(
+    queries: List[str], live: List[int], plan: _RetrievalPlan, config: VectorStoreConfig
+) -> Tuple[Optional[LexicalIndex], Dict[int, List[str]]]:
+    """
+    Loads the lexical index (None if disabled/not built) and resolves exact-reference queries.
+    """
+    if not plan.lexical:
+        return None, {}
+    pc = physical_config(config)
+    lex = get_lexical_index(pc.persist_path, pc.collection_name)
+    if lex is None:
+        return None, {}
+    fast: Dict[int, List[str]] = {}
+    if plan.filters is not None and plan.filters.where:
+        return lex, fast  # arbitrary predicates can only be checked by the store: go dense
+    mask = lex.mask(plan.filters)
+    for i in live:
+        ids = lex.reference_chunks(queries[i], plan.top_k, mask)
+        if ids:
+            fast[i] = ids
+    return lex, fast
+
+
+def _search(
+    queries: List[str],
+    dense: List[int],
+    query_embeddings: List[List[float]],
+    fast: Dict[int, List[str]],
+    lex: Optional[LexicalIndex],
+    plan: _RetrievalPlan,
+    config: VectorStoreConfig,
+) -> Dict[int, List[Chunk]]:
+    """
+    Store side of retrieval (blocking): dense query, RRF with BM25, fetching lexical-only hits.
+    """
     collection = get_collection(config, create_if_missing=True)
+    found: Dict[int, List[Chunk]] = {}
+    if dense:
+        results = _query_store(collection, query_embeddings, plan)
+        for row, i in enumerate(dense):
+            found[i] = plan.chunks(results, row, query_embeddings[row])
 
+    wanted: Dict[int, List[str]] = dict(fast)
+    limits: Dict[int, int] = {i: len(ids) for i, ids in fast.items()}
+    if lex is not None:
+        mask = lex.mask(plan.filters)
+        for i in dense:
+            lexical_hits = [cid for cid, _ in lex.search(queries[i], HYBRID_POOL, mask)]
+            ranked = rrf_fuse([[c.id for c in found[i]], lexical_hits])
+            limits[i] = len(found[i]) or plan.top_k
+            # With store-only predicates some lexical hits may be rejected below: keep the tail as backfill.
+            wanted[i] = ranked if plan.where else ranked[: limits[i]]
+
+    # One get() for every chunk that didn't come back from the dense query.
+    have = {c.id: c for i in dense for c in found[i]}
+    missing = list(dict.fromkeys(cid for ids in wanted.values() for cid in ids if cid not in have))
+    rows: Dict[str, Tuple[Any, Any, Any]] = {}
+    if missing:
+        # `where` drops lexical hits that fail predicates the lexical index can't check.
+        got = collection.get(ids=missing, where=plan.where, include=["documents", "metadatas", "embeddings"])
+        embs = got.get("embeddings")
+        for j, cid in enumerate(got["ids"]):
+            emb = embs[j] if embs is not None and len(embs) > j else None
+            rows[str(cid)] = (got["documents"][j], got["metadatas"][j], emb)
+
+    qvec = {i: query_embeddings[row] for row, i in enumerate(dense)}
+    for i, ids in wanted.items():
+        chunks: List[Chunk] = []
+        for cid in ids:
+            if cid in have:
+                chunks.append(have[cid])
+            elif cid in rows:
+                doc, meta, emb = rows[cid]
+                chunks.append(_make_chunk(cid, doc, meta, _cosine_distance(qvec.get(i), emb)))
+        found[i] = chunks[: limits[i]]
+    return found
+
+
+def _cosine_distance(query_embedding: Optional[List[float]], embedding: Any) -> Optional[float]:
+    # Lexical-only hits have no store distance: 1 - cos, the metric _query_store() returns.
+    if query_embedding is None or embedding is None:
+        return None
+    q = np.asarray(query_embedding, dtype=np.float32)
+    e = np.asarray(embedding, dtype=np.float32)
+    denom = float(np.linalg.norm(q) * np.linalg.norm(e))
+    return 1.0 - float(q @ e) / denom if denom else None
+
+
+def _query_store(collection: Any, query_embeddings: List[List[float]], plan: _RetrievalPlan) -> Dict[str, Any]:
+    include = ["documents", "metadatas", "distances"]
+    if plan.mmr:
+        include.append("embeddings")
     results = collection.query(
-        query_texts=[query],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"],
+        query_embeddings=query_embeddings,
+        n_results=plan.fetch_k if plan.mmr else plan.top_k,
+        where=plan.where,
+        include=include,
     )
+    space = distance_space(collection)
+    if space != "cosine" and results.get("distances") is not None:
+        # Collection built before we created them in cosine space: bring it to 1 - cos.
+        results["distances"] = [[to_cosine_distance(d, space) for d in row] for row in results["distances"]]
+    return results
 
-    docs = (results.get("documents") or [[]])[0]
-    metas = (results.get("metadatas") or [[]])[0]
-    dists = (results.get("distances") or [[]])[0]
-    ids = (results.get("ids") or [[]])[0]
-
-    chunks: List[Chunk] = []
-    for doc, meta, dist, _id in zip(docs, metas, dists, ids):
-        meta = meta or {}
-        chunks.append(
-            Chunk(
-                id=str(_id),
-                text=str(doc),
-                source=meta.get("source"),
-                chunk_index=meta.get("chunk_index"),
-                distance=float(dist) if dist is not None else None,
-                metadata=dict(meta),
-            )
+
+async def retrieve_async(
+    query: str,
+    *,
+    top_k: int = 4,
+    config: VectorStoreConfig = VectorStoreConfig(),
+    mmr: Optional[bool] = None,
+    fetch_k: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+    adaptive: Optional[bool] = None,
+    lexical: Optional[bool] = None,
+    filters: Optional[RetrievalFilter] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Chunk]:
+    """
+    Async retrieve(): the embedding call is awaited, the store query runs in a worker thread.
+    """
+    return (
+        await retrieve_many_async(
+            [query],
+            top_k=top_k,
+            config=config,
+            mmr=mmr,
+            fetch_k=fetch_k,
+            mmr_lambda=mmr_lambda,
+            adaptive=adaptive,
+            lexical=lexical,
+            filters=filters,
+            timings=timings,
         )
+    )[0]
 
-    return chunks
 
+async def retrieve_many_async(
+    queries: List[str],
+    *,
+    top_k: int = 4,
+    config: VectorStoreConfig = VectorStoreConfig(),
+    mmr: Optional[bool] = None,
+    fetch_k: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+    adaptive: Optional[bool] = None,
+    lexical: Optional[bool] = None,
+    filters: Optional[RetrievalFilter] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[List[Chunk]]:
+    out: List[List[Chunk]] = [[] for _ in queries]
+    live = [i for i, q in enumerate(queries) if q and q.strip()]
+    if not live:
+        return out
+
+    plan = _RetrievalPlan.build(top_k, mmr, fetch_k, mmr_lambda, adaptive, lexical, filters)
+    # Chroma, the numpy store and the lexical index are sync; keep them off the event loop.
+    t0 = time.perf_counter()
+    lex, fast = await asyncio.to_thread(_lexical_fast_path, queries, live, plan, config)
+    dense = [i for i in live if i not in fast]
+    t1 = time.perf_counter()
+    query_embeddings = await embed_queries_async([queries[i] for i in dense], config=config) if dense else []
+    t2 = time.perf_counter()
+    found = await asyncio.to_thread(_search, queries, dense, query_embeddings, fast, lex, plan, config)
+    _record_timings(timings, t0, t1, t2, time.perf_counter())
+
+    for i, chunks in found.items():
+        out[i] = chunks
+    return out
 
-def format_context(chunks: List[Chunk]) -> str:
+
+def format_context(chunks: List[Chunk], *, max_tokens: Optional[int] = None) -> str:
     """
     Formats retrieved chunks into a context block with stable numeric citations [1], [2], ...
     (We don't use chunk_index for citations because it's document-dependent and can be sparse.)
-    """
-    if not chunks:
-        return "No relevant context found."
 
-    lines: List[str] = []
-    for i, ch in enumerate(chunks, start=1):
-        lines.append(f"[{i}] {ch.text}")
-    return "\n\n".join(lines)
+    Neighbouring chunks are merged without their overlap and the whole block is kept
+    within `max_tokens`; see rag.context.pack_context for the citation -> chunk id map.
+    """
+    return pack_context(chunks, max_tokens=max_tokens).text
@@ -0,0 +1,115 @@
+# rag/singleflight.py
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import weakref
+from dataclasses import asdict, is_dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def flight_key(*parts: Any) -> str:
+    """
+    Stable key from plain values and dataclasses (e.g. a RetrievalFilter, whose
+    `where` dict isn't hashable).
+    """
+    return json.dumps(
+        [asdict(p) if is_dataclass(p) else p for p in parts], sort_keys=True, default=str
+    )
+
+
+class _Call(Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key (threads): the first caller runs `fn`,
+    the ones arriving while it is in flight wait and get the same result (or exception).
+    Nothing is kept once the call returns; this is not a cache.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Returns (result, shared); shared=True if the result came from another caller's run.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines. The work runs in its own task, so a caller that gets
+    cancelled doesn't cancel it for the others. In-flight calls are tracked per event loop.
+    """
+
+    def __init__(self) -> None:
+        self._calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        # No lock needed: there is no await between the lookup and the insert.
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        calls[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda _: calls.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": sum(len(c) for c in self._calls.values()),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -1,14 +1,31 @@
 # rag/store.py
 from __future__ import annotations
 
+import json
 import os
-from dataclasses import dataclass
-from typing import Optional, Tuple
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import chromadb
 from chromadb.api.models.Collection import Collection
 from chromadb.utils import embedding_functions
 
+try:
+    import fcntl
+except ImportError:  # Windows: alias updates are only serialized within the process
+    fcntl = None
+
+from rag.embedding_cache import CachedOpenAIEmbeddingFunction, get_embedding_cache
+from rag.lexical import delete_lexical_index
+from rag.manifest import IngestManifest, delete_manifest
+from rag.numpy_store import NumpyCollection, delete_numpy_collection
+from rag.openai_client import get_openai_api_key
+
 
 @dataclass(frozen=True)
 class VectorStoreConfig:
@@ -24,28 +41,95 @@ class VectorStoreConfig:
     embedding_model: str = "text-embedding-3-small"
     openai_api_key_env: str = "OPENAI_API_KEY"
 
+    # "chroma" (default) or "numpy" (memory-mapped matrix, good for single-document corpora)
+    backend: str = os.getenv("VECTOR_BACKEND", "chroma")
+
+    # Content-addressed embedding cache (empty path disables it)
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite3")
+    embedding_cache_max_entries: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+    # In-memory LRU/TTL cache of query vectors used by retrieve() (0 disables it)
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    query_cache_ttl_s: float = float(os.getenv("QUERY_CACHE_TTL_S", "3600"))
+
+    # Blue/green mode: `collection_name` is an alias to the live `<name>.v<version>` collection
+    versioned: bool = os.getenv("VECTOR_STORE_VERSIONED", "0") == "1"
+    version_grace_s: float = float(os.getenv("VECTOR_STORE_VERSION_GRACE_S", "3600"))
+
+
+def _numpy_root(config: VectorStoreConfig) -> Path:
+    return Path(config.persist_path) / "numpy"
+
+
+# Distances handed to the rest of the package are cosine distances (1 - cos), whatever the
+# backend: Chroma collections are created in cosine space (its default is squared L2).
+_CHROMA_CONFIGURATION = {"hnsw": {"space": "cosine"}}
+
+
+def distance_space(collection: Any) -> str:
+    """
+    Metric of the distances `collection.query()` returns: "cosine", "l2" (squared) or "ip".
+    A collection created before the space was set stays "l2" until it is rebuilt (--reset).
+    """
+    if isinstance(collection, NumpyCollection):
+        return "cosine"
+    configuration = getattr(collection, "configuration", None) or {}
+    return (configuration.get("hnsw") or {}).get("space") or "l2"
+
+
+def to_cosine_distance(distance: float, space: str) -> float:
+    # Embeddings are unit-norm: ||q - e||^2 = 2 * (1 - cos) and 1 - q.e = 1 - cos.
+    return distance / 2.0 if space == "l2" else distance
+
+
+# Process-wide registry: one client per persist path, one collection handle per config.
+# Streamlit reruns and every retrieve() used to rebuild both (reopening SQLite/HNSW files).
+_REGISTRY_LOCK = threading.RLock()
+_CLIENTS: Dict[str, chromadb.PersistentClient] = {}
+_COLLECTIONS: Dict[VectorStoreConfig, Collection] = {}
+_EMBEDDING_FUNCTIONS: Dict[VectorStoreConfig, object] = {}
+_REGISTRY_STATS = {"hits": 0, "misses": 0}
 
-def _get_openai_api_key(env_name: str = "OPENAI_API_KEY") -> str:
-    key = os.getenv(env_name)
-    if not key:
-        raise RuntimeError(
-            f"Missing {env_name}. Set it in your environment or .env file."
-        )
-    return key
 
 # It makes the client.
 def get_chroma_client(config: VectorStoreConfig = VectorStoreConfig()) -> chromadb.PersistentClient:
     """
-    Returns a persistent Chroma client.
+    Returns a persistent Chroma client (shared per persist path).
     """
-    return chromadb.PersistentClient(path=config.persist_path)
+    with _REGISTRY_LOCK:
+        client = _CLIENTS.get(config.persist_path)
+        if client is None:
+            client = chromadb.PersistentClient(path=config.persist_path)
+            _CLIENTS[config.persist_path] = client
+        return client
 
 
 def get_embedding_function(config: VectorStoreConfig = VectorStoreConfig()):
     """
-    Returns Chroma's built-in OpenAI embedding function.
+    Returns Chroma's built-in OpenAI embedding function,
+    wrapped by the on-disk embedding cache unless it is disabled.
+    One instance is kept per config so its HTTP client is reused.
     """
-    api_key = _get_openai_api_key(config.openai_api_key_env)
+    with _REGISTRY_LOCK:
+        ef = _EMBEDDING_FUNCTIONS.get(config)
+        if ef is None:
+            ef = _build_embedding_function(config)
+            _EMBEDDING_FUNCTIONS[config] = ef
+        return ef
+
+
+def _build_embedding_function(config: VectorStoreConfig):
+    api_key = get_openai_api_key(config.openai_api_key_env)
+    if config.embedding_cache_path:
+        cache = get_embedding_cache(
+            config.embedding_cache_path,
+            max_entries=config.embedding_cache_max_entries,
+        )
+        return CachedOpenAIEmbeddingFunction(
+            cache=cache,
+            api_key=api_key,
+            model_name=config.embedding_model,
+        )
     return embedding_functions.OpenAIEmbeddingFunction(
         api_key=api_key,
         model_name=config.embedding_model,
@@ -62,21 +146,48 @@ def get_collection(
 
     - `create_if_missing=True` is convenient for local dev and first-time runs.
     - In CI, you might set it to False if you want to enforce a pre-built index.
+
+    Handles are cached per config; `reset_collection` invalidates the entry.
+    With `backend="numpy"` a NumpyCollection is returned (same API subset).
+    With `versioned=True` the alias is resolved to the live version first.
     """
-    client = get_chroma_client(config)
-    ef = get_embedding_function(config)
+    if config.versioned:
+        return get_collection(physical_config(config), create_if_missing=create_if_missing)
 
-    if create_if_missing:
-        return client.get_or_create_collection(
-            name=config.collection_name,
-            embedding_function=ef,
-        )
+    with _REGISTRY_LOCK:
+        cached = _COLLECTIONS.get(config)
+        if cached is not None:
+            _REGISTRY_STATS["hits"] += 1
+            return cached
 
-    # If you want strict behavior (fail if missing)
-    return client.get_collection(
-        name=config.collection_name,
-        embedding_function=ef,
-    )
+        _REGISTRY_STATS["misses"] += 1
+        ef = get_embedding_function(config)
+
+        if config.backend == "numpy":
+            col = NumpyCollection(_numpy_root(config), config.collection_name, embedding_function=ef)
+            if not create_if_missing and col.count() == 0:
+                raise ValueError(f"Collection {config.collection_name} does not exist.")
+            _COLLECTIONS[config] = col
+            return col
+        if config.backend != "chroma":
+            raise ValueError(f"Unknown vector store backend: {config.backend!r}")
+
+        client = get_chroma_client(config)
+        if create_if_missing:
+            col = client.get_or_create_collection(
+                name=config.collection_name,
+                embedding_function=ef,
+                configuration=_CHROMA_CONFIGURATION,
+            )
+        else:
+            # If you want strict behavior (fail if missing)
+            col = client.get_collection(
+                name=config.collection_name,
+                embedding_function=ef,
+            )
+
+        _COLLECTIONS[config] = col
+        return col
 
 
 def collection_count(config: VectorStoreConfig = VectorStoreConfig()) -> int:
@@ -87,10 +198,50 @@ def collection_count(config: VectorStoreConfig = VectorStoreConfig()) -> int:
     return col.count()
 
 
-def reset_collection(config: VectorStoreConfig = VectorStoreConfig()) -> Collection:
+def indexed_sources(config: VectorStoreConfig = VectorStoreConfig()) -> List[str]:
     """
-    Deletes and recreates the collection. Useful for deterministic rebuilds.
+    Source names (PDF file names) currently in the collection, from its ingest manifest.
+    """
+    pc = physical_config(config)
+    return sorted(IngestManifest.for_collection(pc.persist_path, pc.collection_name).sources)
+
+
+def invalidate_collection_cache(config: Optional[VectorStoreConfig] = None) -> None:
+    """
+    Drops cached collection handles (all of them if config is None).
+    Clients are kept: they are per persist path and stay valid across collection resets.
+    """
+    with _REGISTRY_LOCK:
+        if config is None:
+            _COLLECTIONS.clear()
+            return
+        for key in [k for k in _COLLECTIONS if k.persist_path == config.persist_path
+                    and k.collection_name == config.collection_name]:
+            del _COLLECTIONS[key]
+
+
+def registry_stats() -> Dict[str, int]:
     """
+    Hit/miss counters of the collection registry (for logs/monitoring).
+    """
+    with _REGISTRY_LOCK:
+        return {
+            "hits": _REGISTRY_STATS["hits"],
+            "misses": _REGISTRY_STATS["misses"],
+            "clients": len(_CLIENTS),
+            "collections": len(_COLLECTIONS),
+        }
+
+
+def _drop_collection(config: VectorStoreConfig) -> None:
+    invalidate_collection_cache(config)
+    delete_manifest(config.persist_path, config.collection_name)
+    delete_lexical_index(config.persist_path, config.collection_name)
+
+    if config.backend == "numpy":
+        delete_numpy_collection(_numpy_root(config), config.collection_name)
+        return
+
     client = get_chroma_client(config)
     try:
         client.delete_collection(name=config.collection_name)
@@ -98,8 +249,202 @@ def reset_collection(config: VectorStoreConfig = VectorStoreConfig()) -> Collect
         # Collection might not exist yet
         pass
 
-    ef = get_embedding_function(config)
-    return client.get_or_create_collection(
-        name=config.collection_name,
-        embedding_function=ef,
-    )
+
+def reset_collection(config: VectorStoreConfig = VectorStoreConfig()) -> Collection:
+    """
+    Deletes and recreates the collection. Useful for deterministic rebuilds.
+
+    In versioned mode the live version is not touched: readers are switched to a
+    new empty version and the old one is garbage-collected after the grace period.
+    Prefer `rebuilding()` so readers keep the old data until the new build is done.
+    """
+    with _REGISTRY_LOCK:
+        if config.versioned:
+            target = begin_rebuild(config)
+            promote_version(config, target)
+            return get_collection(target, create_if_missing=True)
+
+        _drop_collection(config)
+        return get_collection(config, create_if_missing=True)
+
+
+# -----------------------------
+# Blue/green versions
+# -----------------------------
+# aliases.json (next to the Chroma data):
+# {"rag-docs": {"current": "rag-docs.v20250101120000-ab12cd",
+#               "versions": {"rag-docs.v...": {"status": "live|building|retired|failed",
+#                                              "created_at": ..., "retired_at": ...}},
+#               "base_retired": true}}
+# Chroma only allows [a-zA-Z0-9._-] in names, hence `.v` instead of `@`.
+_ALIASES_FILE = "aliases.json"
+_ALIAS_CACHE: Dict[str, Tuple[Optional[int], Dict[str, Any]]] = {}
+
+
+def _aliases_path(config: VectorStoreConfig) -> Path:
+    return Path(config.persist_path) / _ALIASES_FILE
+
+
+@contextmanager
+def _locked_aliases(config: VectorStoreConfig) -> Iterator[Dict[str, Any]]:
+    """
+    Read-modify-write access to aliases.json: yields a fresh copy of its content while
+    holding an exclusive lock (threads and, via flock, other processes such as a
+    concurrent `python -m rag.ingest --reset`). Call _write_aliases inside the block.
+    """
+    path = _aliases_path(config)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _REGISTRY_LOCK, open(path.with_suffix(".lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+        data = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        yield data
+
+
+def _read_aliases(config: VectorStoreConfig) -> Dict[str, Any]:
+    # Cached by mtime: get_collection() resolves the alias on every call.
+    path = _aliases_path(config)
+    mtime = path.stat().st_mtime_ns if path.exists() else None
+    with _REGISTRY_LOCK:
+        cached = _ALIAS_CACHE.get(config.persist_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        data = json.loads(path.read_text(encoding="utf-8")) if mtime is not None else {}
+        _ALIAS_CACHE[config.persist_path] = (mtime, data)
+        return data
+
+
+def _write_aliases(config: VectorStoreConfig, data: Dict[str, Any]) -> None:
+    path = _aliases_path(config)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(tmp, path)  # atomic flip for readers in other processes
+    _ALIAS_CACHE[config.persist_path] = (path.stat().st_mtime_ns, data)
+
+
+def physical_config(config: VectorStoreConfig) -> VectorStoreConfig:
+    """
+    Resolves a versioned config to the config of the live physical collection.
+    Before the first promotion this is the plain `collection_name`.
+    """
+    if not config.versioned:
+        return config
+    record = _read_aliases(config).get(config.collection_name) or {}
+    name = record.get("current") or config.collection_name
+    return replace(config, collection_name=name, versioned=False)
+
+
+def begin_rebuild(config: VectorStoreConfig) -> VectorStoreConfig:
+    """
+    Registers a new, empty version and returns the config to ingest into.
+    Readers keep using the current version until `promote_version`.
+    """
+    version = time.strftime("%Y%m%d%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:6]
+    target = replace(config, collection_name=f"{config.collection_name}.v{version}", versioned=False)
+
+    with _locked_aliases(config) as data:
+        record = data.setdefault(config.collection_name, {"current": None, "versions": {}})
+        record["versions"][target.collection_name] = {
+            "status": "building",
+            "created_at": time.time(),
+            "retired_at": None,
+        }
+        _write_aliases(config, data)
+        _drop_collection(target)
+    return target
+
+
+def promote_version(config: VectorStoreConfig, target: VectorStoreConfig) -> None:
+    """
+    Atomically points the alias at `target`, retires the previous version and
+    garbage-collects versions whose grace period has passed. On the first promotion
+    the previous version is the plain `collection_name` collection that served until then.
+    """
+    with _locked_aliases(config) as data:
+        record = data.setdefault(config.collection_name, {"current": None, "versions": {}})
+        now = time.time()
+
+        previous = record.get("current")
+        if previous and previous in record["versions"] and previous != target.collection_name:
+            record["versions"][previous].update(status="retired", retired_at=now)
+
+        record["versions"].setdefault(target.collection_name, {"created_at": now})
+        record["versions"][target.collection_name].update(status="live", retired_at=None)
+        record["current"] = target.collection_name
+        _retire_base(config, record, now)
+        _write_aliases(config, data)
+
+    gc_versions(config)
+
+
+def abort_rebuild(config: VectorStoreConfig, target: VectorStoreConfig) -> None:
+    """
+    Drops a version whose build failed. It was never served, so no grace period.
+    """
+    with _locked_aliases(config) as data:
+        record = data.get(config.collection_name) or {"versions": {}}
+        record["versions"].pop(target.collection_name, None)
+        _write_aliases(config, data)
+        _drop_collection(target)
+
+
+def gc_versions(config: VectorStoreConfig, *, grace_s: Optional[float] = None) -> List[str]:
+    """
+    Deletes retired versions older than the grace period. Returns deleted names.
+    """
+    grace = config.version_grace_s if grace_s is None else grace_s
+    deleted: List[str] = []
+    with _locked_aliases(config) as data:
+        record = data.get(config.collection_name)
+        if not record:
+            return deleted
+
+        now = time.time()
+        changed = _retire_base(config, record, now)
+        for name, info in list(record["versions"].items()):
+            if info.get("status") == "retired" and now - (info.get("retired_at") or now) >= grace:
+                _drop_collection(replace(config, collection_name=name, versioned=False))
+                del record["versions"][name]
+                deleted.append(name)
+
+        if deleted or changed:
+            _write_aliases(config, data)
+    return deleted
+
+
+def _retire_base(config: VectorStoreConfig, record: Dict[str, Any], now: float) -> bool:
+    """
+    Once the alias points at a version, the unversioned `collection_name` collection (what
+    readers used before the first promotion) is just another retired version for gc.
+    Also picks it up for stores promoted before it was tracked. Returns True if added.
+    """
+    base = config.collection_name
+    if record.get("base_retired") or not record.get("current") or record["current"] == base:
+        return False
+    record["versions"].setdefault(base, {"created_at": None})
+    record["versions"][base].update(status="retired", retired_at=now)
+    record["base_retired"] = True  # gc removes the entry; don't add it back
+    return True
+
+
+@contextmanager
+def rebuilding(config: VectorStoreConfig = VectorStoreConfig()) -> Iterator[VectorStoreConfig]:
+    """
+    Yields the config a full rebuild should write into.
+
+    - unversioned: the collection is reset in place (readers see a partial index meanwhile)
+    - versioned: a new version is built and published only if the block succeeds
+    """
+    if not config.versioned:
+        reset_collection(config)
+        yield config
+        return
+
+    target = begin_rebuild(config)
+    try:
+        yield target
+    except BaseException:
+        abort_rebuild(config, target)
+        raise
+    promote_version(config, target)
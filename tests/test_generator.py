@@ -0,0 +1,48 @@
+# tests/test_generator.py
+import pytest
+
+from rag import generator
+from rag.retriever import Chunk
+
+
+def _chunks(*distances):
+    return [
+        Chunk(id=f"t.pdf-{i}", text="text", source="t.pdf", chunk_index=i, distance=d, metadata={})
+        for i, d in enumerate(distances)
+    ]
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    def set_gate(min_distance=None, mean_distance=None):
+        monkeypatch.setattr(generator, "REFUSAL_GATE_MIN_DISTANCE", min_distance)
+        monkeypatch.setattr(generator, "REFUSAL_GATE_MEAN_DISTANCE", mean_distance)
+
+    set_gate()
+    return set_gate
+
+
+def test_short_circuit_disabled_by_default(gate):
+    assert not generator._should_short_circuit(_chunks(1.9, 1.9))
+    assert generator._should_short_circuit([])  # nothing retrieved at all
+
+
+def test_short_circuit_min_distance_ceiling(gate):
+    gate(min_distance=0.5)
+    assert generator._should_short_circuit(_chunks(0.6, 0.9))  # even the best hit is too far
+    assert not generator._should_short_circuit(_chunks(0.4, 1.5))  # one close hit is enough
+    assert not generator._should_short_circuit(_chunks(0.5))  # ceiling is inclusive
+
+
+def test_short_circuit_mean_distance_ceiling(gate):
+    gate(mean_distance=0.6)
+    assert generator._should_short_circuit(_chunks(0.3, 1.1))  # mean 0.7
+    assert not generator._should_short_circuit(_chunks(0.3, 0.8))  # mean 0.55
+
+
+def test_short_circuit_ignores_chunks_without_distance(gate):
+    gate(min_distance=0.1, mean_distance=0.1)
+    # exact-reference fast path hits carry no distance: let the model decide
+    assert not generator._should_short_circuit(_chunks(None, None))
+    # mixed: only the distances that exist are judged
+    assert generator._should_short_circuit(_chunks(None, 0.9))
@@ -0,0 +1,54 @@
+# tests/test_retriever.py
+import math
+
+import chromadb
+import pytest
+
+from rag import retriever
+from rag.lexical import build_lexical_index
+from rag.store import VectorStoreConfig, get_collection, get_embedding_function
+
+QUERY = [1.0, 0.0]
+DOCS = {
+    "near": ("alpha clause", [1.0, 0.0]),
+    "mid": ("beta clause", [0.6, 0.8]),  # cos = 0.6
+    "lexical": ("zebra zebra", [0.0, 1.0]),  # only BM25 finds it for "zebra"
+}
+
+
+def _store(tmp_path, monkeypatch, backend: str, space: str = "cosine") -> VectorStoreConfig:
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(retriever, "embed_queries", lambda queries, config: [QUERY for _ in queries])
+    config = VectorStoreConfig(
+        persist_path=str(tmp_path), collection_name=f"test-{backend}-{space}", backend=backend, embedding_cache_path=""
+    )
+    if space != "cosine":
+        # a collection created before get_collection() set the space
+        chromadb.PersistentClient(path=str(tmp_path)).get_or_create_collection(
+            config.collection_name, embedding_function=get_embedding_function(config), configuration={"hnsw": {"space": space}}
+        )
+    col = get_collection(config)
+    col.add(
+        ids=list(DOCS),
+        documents=[d for d, _ in DOCS.values()],
+        metadatas=[{"source": "t.pdf", "chunk_index": i} for i in range(len(DOCS))],
+        embeddings=[e for _, e in DOCS.values()],
+    )
+    build_lexical_index(col, config.persist_path, config.collection_name)
+    return config
+
+
+@pytest.mark.parametrize("backend,space", [("chroma", "cosine"), ("chroma", "l2"), ("numpy", "cosine")])
+def test_dense_and_lexical_only_hits_share_one_distance_scale(tmp_path, monkeypatch, backend, space):
+    config = _store(tmp_path, monkeypatch, backend, space)
+
+    hybrid = {c.id: c.distance for c in retriever.retrieve("zebra", top_k=2, config=config, lexical=True, adaptive=False)}
+    dense = {c.id: c.distance for c in retriever.retrieve("zebra", top_k=3, config=config, lexical=False, adaptive=False)}
+
+    assert set(hybrid) == {"near", "lexical"}  # one dense hit, one lexical-only hit
+    for cid, distance in hybrid.items():
+        assert distance == pytest.approx(dense[cid], abs=1e-5)
+    # cosine distance (1 - cos) on every backend
+    assert dense["mid"] == pytest.approx(0.4, abs=1e-5)
+    assert hybrid["lexical"] == pytest.approx(1.0, abs=1e-5)
+    assert not any(math.isnan(d) for d in hybrid.values())